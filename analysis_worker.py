@@ -0,0 +1,37 @@
+"""
+Celery worker for long-running medical analyses
+Job state lives in Redis so every uvicorn worker can see it
+
+Run with: celery -A analysis_worker.celery_app worker --loglevel=info
+"""
+
+import asyncio
+import os
+
+from celery import Celery
+
+# Import our MCP-enabled medical agent
+from medical_agent_mcp import analyze_with_billing
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+celery_app = Celery("medical", broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    task_track_started=True,
+    result_expires=3600,  # Evict finished jobs after an hour
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+)
+
+@celery_app.task(name="medical.process_analysis")
+def process_analysis(request_data: dict, customer_id: str):
+    """Worker task to process analysis with MCP"""
+    try:
+        return asyncio.run(analyze_with_billing(request_data, customer_id))
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "billed": False
+        }
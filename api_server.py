@@ -3,20 +3,31 @@ FastAPI wrapper for the Medical Agent with MCP
 This properly integrates with FastAgent and MCP servers
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import logging
+import sys
 from typing import Optional
-import uuid
+import orjson
+from celery.result import AsyncResult
+
+# Configure logging once, before the agent modules are imported
+logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(asctime)s %(message)s")
+logger = logging.getLogger(__name__)
 
 # Import our MCP-enabled medical agent
-from medical_agent_mcp import analyze_with_billing, BILLING_TIERS
+from medical_agent_mcp import analyze_with_billing, record_billing, stream_document, start_agent, stop_agent
+from billing_tiers import BILLING_TIERS, DEFAULT_TIER, tier_catalog
+from analysis_worker import celery_app, process_analysis
 
 app = FastAPI(
     title="Medical Analysis API",
     description="AI-powered medical document analysis with MCP integration",
-    version="3.0.0"
+    version="3.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -28,14 +39,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store analysis jobs for async processing
-analysis_jobs = {}
+# Queries shorter than this are answered inline; larger ones go to the workers
+SYNC_QUERY_MAX_CHARS = 500
 
 class AnalysisRequest(BaseModel):
     customer_id: str
     type: str = "basic"
     query: Optional[str] = None
     file_path: Optional[str] = None
+    cache: bool = True  # Set False to keep PHI-sensitive results out of the cache
+    stream: bool = False  # Stream inline results as server-sent events
 
 class AnalysisResponse(BaseModel):
     status: str
@@ -46,17 +59,38 @@ class AnalysisResponse(BaseModel):
     tier: Optional[str] = None
     price: Optional[float] = None
 
-async def process_analysis(job_id: str, request_data: dict, customer_id: str):
-    """Background task to process analysis with MCP"""
+def _sse_event(event: dict) -> bytes:
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+async def stream_analysis(request: AnalysisRequest):
+    """Server-sent events: analysis text as it arrives, then billing info"""
+    tier = BILLING_TIERS.get(request.type, DEFAULT_TIER)
     try:
-        result = await analyze_with_billing(request_data, customer_id)
-        analysis_jobs[job_id] = result
+        async for chunk in stream_document(
+            query=request.query or "",
+            file_path=request.file_path,
+            use_cache=request.cache
+        ):
+            yield _sse_event({"type": "delta", "text": chunk})
+        
+        # Bill the same way the non-streaming path does before reporting billed
+        await record_billing(request.customer_id, request.type)
+        
+        yield _sse_event({
+            "type": "done",
+            "status": "success",
+            "billed": True,
+            "tier": request.type,
+            "price": tier.price,
+            "customer_id": request.customer_id
+        })
     except Exception as e:
-        analysis_jobs[job_id] = {
+        yield _sse_event({
+            "type": "done",
             "status": "error",
             "error": str(e),
             "billed": False
-        }
+        })
 
 @app.get("/health")
 async def health_check():
@@ -64,28 +98,26 @@ async def health_check():
     return {"status": "healthy", "service": "medical-agent", "mcp": "enabled"}
 
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_document(request: AnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_document(request: AnalysisRequest):
     """Submit medical document for analysis"""
     try:
         # For quick testing, try synchronous analysis first
-        if (request.query and len(request.query) < 500) or request.file_path:  # Small queries or file analysis
+        is_small = bool(request.query) and len(request.query) < SYNC_QUERY_MAX_CHARS
+        if is_small or request.file_path:  # Small queries or file analysis
+            if request.stream:
+                return StreamingResponse(stream_analysis(request), media_type="text/event-stream")
+            
             # Try direct analysis
             result = await analyze_with_billing(request.model_dump(), request.customer_id)
             if result["status"] == "success":
                 return AnalysisResponse(**result)
         
-        # For larger requests or if direct fails, use background processing
-        job_id = str(uuid.uuid4())
-        background_tasks.add_task(
-            process_analysis, 
-            job_id, 
-            request.model_dump(), 
-            request.customer_id
-        )
+        # For larger requests or if direct fails, hand off to the Celery workers
+        task = process_analysis.delay(request.model_dump(), request.customer_id)
         
         return AnalysisResponse(
             status="processing",
-            job_id=job_id,
+            job_id=task.id,
             tier=request.type
         )
         
@@ -99,14 +131,25 @@ async def analyze_document(request: AnalysisRequest, background_tasks: Backgroun
 @app.get("/api/job/{job_id}")
 async def get_job_status(job_id: str):
     """Check analysis job status"""
-    if job_id in analysis_jobs:
-        return analysis_jobs[job_id]
+    task = AsyncResult(job_id, app=celery_app)
+    
+    if task.state == "SUCCESS":
+        return ORJSONResponse(task.result)
+    if task.state == "FAILURE":
+        return {
+            "status": "error",
+            "job_id": job_id,
+            "error": str(task.result),
+            "billed": False
+        }
+    if task.state in ("STARTED", "RETRY"):
+        return {"status": "processing", "job_id": job_id}
     return {"status": "pending", "job_id": job_id}
 
 @app.get("/api/billing/tiers")
 async def get_billing_tiers():
     """Get available billing tiers"""
-    return BILLING_TIERS
+    return tier_catalog()
 
 @app.get("/api/test-customer")
 async def get_test_customer():
@@ -121,10 +164,16 @@ async def get_test_customer():
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup"""
-    print("🏥 Medical Analysis API Starting...")
-    print("🔌 MCP Integration: Enabled")
-    print("📍 Docs: http://localhost:8000/docs")
-    print("💳 Test customer: /api/test-customer")
+    await start_agent()
+    logger.info(
+        "[API] Medical Analysis API started [MCP] enabled [DOCS] /docs [TEST] /api/test-customer",
+        extra={"mcp": "enabled", "port": 8000}
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Tear down the shared agent session"""
+    await stop_agent()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,29 @@
+"""
+Billing tiers shared by the FastAgent-based medical agents
+
+Prices are stored as integer cents so billing never multiplies floats.
+The mapping is read-only; use tier_catalog() for a JSON-ready copy.
+"""
+
+from types import MappingProxyType, SimpleNamespace
+from typing import Dict, Any
+
+_TIERS = {
+    "basic": (10, "Basic SOAP analysis"),
+    "comprehensive": (50, "Full medical record analysis"),
+    "batch": (5, "Bulk processing per document")
+}
+
+BILLING_TIERS = MappingProxyType({
+    name: SimpleNamespace(cents=cents, price=cents / 100, description=description)
+    for name, (cents, description) in _TIERS.items()
+})
+
+DEFAULT_TIER = BILLING_TIERS["basic"]
+
+def tier_catalog() -> Dict[str, Dict[str, Any]]:
+    """Billing tiers as plain dicts, for API responses"""
+    return {
+        name: {"price": tier.price, "description": tier.description}
+        for name, tier in BILLING_TIERS.items()
+    }
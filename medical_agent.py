@@ -1,18 +1,38 @@
 import asyncio
 from mcp_agent.core.fastagent import FastAgent
-from datetime import datetime
+from dataclasses import dataclass, field
+from collections import defaultdict
+import contextvars
 import os
-from typing import Dict, Any, Optional
+import re
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from billing_tiers import BILLING_TIERS, DEFAULT_TIER
+from pybloom_live import BloomFilter
 
 # Create the FastAgent instance
 fast = FastAgent("Medical Information Processor")
 
-# Billing tiers configuration
-BILLING_TIERS = {
-    "basic": {"price": 0.10, "description": "Basic SOAP analysis"},
-    "comprehensive": {"price": 0.50, "description": "Full medical record analysis"},
-    "batch": {"price": 0.05, "description": "Bulk processing per document"}
-}
+@dataclass(frozen=True, slots=True)
+class ServerCfg:
+    """Server-mode options, resolved once from the FastAgent CLI args"""
+    server: bool
+    transport: str = "sse"
+    host: str = "0.0.0.0"
+    port: int = 8000
+    
+    @classmethod
+    def from_args(cls, args) -> "ServerCfg":
+        defaults = cls(server=False)
+        return cls(
+            server=bool(getattr(args, 'server', False)),
+            transport=getattr(args, 'transport', None) or defaults.transport,
+            host=getattr(args, 'host', None) or defaults.host,
+            port=getattr(args, 'port', None) or defaults.port
+        )
+
+SERVER_CFG = ServerCfg.from_args(fast.args)
 
 @fast.agent(
     name="medical_analyzer",
@@ -38,19 +58,45 @@ async def medical_analyzer_agent():
     """Commercial medical analysis agent with usage tracking"""
     pass
 
+# Second-resolution wall clock refreshed by a background ticker - Stripe only needs seconds
+_now_s = int(time.time())
+_clock_task: Optional[asyncio.Task] = None
+
+async def _tick_clock():
+    global _now_s
+    while True:
+        await asyncio.sleep(1)
+        _now_s = int(time.time())
+
+def now_s() -> int:
+    """Current Unix time in whole seconds, at most about a second stale"""
+    global _now_s, _clock_task
+    if _clock_task is None or _clock_task.done():
+        _now_s = int(time.time())
+        _clock_task = asyncio.create_task(_tick_clock(), context=contextvars.Context())
+    return _now_s
+
 # Middleware for usage tracking
-async def track_usage(request_type: str, customer_id: str, agent):
+async def track_usage(
+    request_type: str,
+    customer_id: str,
+    agent,
+    quantity: int = 1,
+    timestamp: Optional[int] = None,
+    idempotency_key: Optional[str] = None
+):
     """Track and bill for API usage"""
-    tier = BILLING_TIERS.get(request_type, BILLING_TIERS["basic"])
+    tier = BILLING_TIERS.get(request_type, DEFAULT_TIER)
     
     try:
         # Create Stripe usage record
         result = await agent.call_tool("create_usage_record", {
             "customer": customer_id,
-            "quantity": 1,
-            "amount": int(tier["price"] * 100),  # Convert to cents
-            "description": f"Medical analysis - {tier['description']}",
-            "timestamp": int(datetime.now().timestamp())
+            "quantity": quantity,
+            "amount": tier.cents * quantity,
+            "description": f"Medical analysis - {tier.description}",
+            "timestamp": timestamp or now_s(),
+            "idempotency_key": idempotency_key
         })
         return result
     except Exception as e:
@@ -58,32 +104,174 @@ async def track_usage(request_type: str, customer_id: str, agent):
         # Log but don't fail the request
         return None
 
+@dataclass(frozen=True, slots=True)
+class UsageBatch:
+    """Summed usage for one (customer, tier), sent to Stripe as one usage record
+    
+    The idempotency key is minted once per batch: a retry of the same quantity
+    reuses it, and two batches never share one.
+    """
+    customer_id: str
+    request_type: str
+    quantity: int
+    timestamp: int
+    idempotency_key: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+class UsageAggregator:
+    """Buffer usage events in memory and flush summed quantities to Stripe
+    
+    record() is a dict update with no network I/O. Pending usage is flushed
+    every `flush_interval` seconds, or as soon as `max_pending` events have
+    accumulated, as one usage record per (customer, tier). Batches Stripe
+    didn't accept are retried unchanged on the next flush. Flushes share one
+    agent session, opened on first use.
+    """
+    
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 100):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._pending_events = 0
+        self._window_start = int(time.time())
+        self._unsent: List[UsageBatch] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._flushes = set()
+        self._lock = asyncio.Lock()  # One flush at a time - they share the agent session
+        self._agent_cm = None
+        self._agent = None
+    
+    def record(self, customer_id: str, request_type: str):
+        """Queue one billable event"""
+        self._pending[(customer_id, request_type)] += 1
+        self._pending_events += 1
+        
+        # Flushes read no ContextVars - run them in an empty context instead of copying
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run(), context=contextvars.Context())
+        if self._pending_events >= self.max_pending:
+            task = asyncio.create_task(self.flush(), context=contextvars.Context())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def _session(self):
+        if self._agent is None:
+            agent_cm = fast.run()
+            self._agent = await agent_cm.__aenter__()
+            self._agent_cm = agent_cm
+        return self._agent
+    
+    async def _close_session(self):
+        agent_cm, self._agent_cm, self._agent = self._agent_cm, None, None
+        if agent_cm is not None:
+            try:
+                await agent_cm.__aexit__(None, None, None)
+            except Exception as e:
+                print(f"Error closing usage session: {e}")
+    
+    async def flush(self):
+        """Send all pending usage, and any batches still unsent, to Stripe"""
+        async with self._lock:
+            # Swap the buffer out first so records arriving mid-flush land in the next window
+            batches, self._unsent = self._unsent, []
+            if self._pending:
+                window_start = self._window_start
+                batches.extend(
+                    UsageBatch(customer_id, request_type, quantity, window_start)
+                    for (customer_id, request_type), quantity in self._pending.items()
+                )
+                self._pending = defaultdict(int)
+                self._pending_events = 0
+                self._window_start = now_s()
+            if not batches:
+                return
+            
+            try:
+                agent = await self._session()
+            except Exception as e:
+                print(f"Error flushing usage: {e}")
+                self._unsent = batches
+                return
+            
+            for batch in batches:
+                result = await track_usage(
+                    batch.request_type,
+                    batch.customer_id,
+                    agent,
+                    quantity=batch.quantity,
+                    timestamp=batch.timestamp,
+                    idempotency_key=batch.idempotency_key
+                )
+                if result is None:
+                    self._unsent.append(batch)
+            
+            # Nothing got through - the session may be broken, so reopen it next time
+            if len(self._unsent) == len(batches):
+                await self._close_session()
+    
+    async def close(self):
+        """Stop the periodic flusher, flush what is left and close the session"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        async with self._lock:
+            await self._close_session()
+
+usage_aggregator = UsageAggregator()
+
+# Customer validation - malformed IDs never reach Stripe, recently verified ones skip the lookup
+_CUS_RE = re.compile(r"^cus_[A-Za-z0-9]{14,32}$")
+_KNOWN_CUSTOMERS_CAPACITY = 10_000
+_known_customers = BloomFilter(capacity=_KNOWN_CUSTOMERS_CAPACITY, error_rate=0.001)
+
+def _remember_customer(customer_id: str):
+    global _known_customers
+    if len(_known_customers) >= _KNOWN_CUSTOMERS_CAPACITY:
+        # Full filters can't take more keys - start a fresh one
+        _known_customers = BloomFilter(capacity=_KNOWN_CUSTOMERS_CAPACITY, error_rate=0.001)
+    _known_customers.add(customer_id)
+
 # API endpoint wrapper for billing
 async def analyze_with_billing(request_data: dict, customer_id: str):
     """Analyze medical document with billing"""
+    if not _CUS_RE.match(customer_id):
+        return {"error": "Invalid customer", "status": "error"}
+    
     async with fast.run() as agent:
         try:
-            # Check customer exists
-            customer = await agent.call_tool("get_customer", {
-                "customer_id": customer_id
-            })
-            
-            if not customer:
-                return {"error": "Invalid customer", "status": "error"}
-            
-            # Track usage
-            await track_usage(request_data.get("type", "basic"), customer_id, agent)
-            
-            # Perform analysis based on request type
             query = request_data.get("query", "")
             file_path = request_data.get("file_path", "")
             
             if file_path:
                 # Analyze specific file
-                result = await agent.send(f"Please analyze the medical document at {file_path}")
+                prompt = f"Please analyze the medical document at {file_path}"
             else:
                 # General query
-                result = await agent.send(query)
+                prompt = query
+            
+            if customer_id in _known_customers:
+                result = await agent.send(prompt)
+            else:
+                # Customer lookup and analysis are independent - start them together
+                # so the Stripe round-trip overlaps the LLM call
+                customer_task = asyncio.create_task(agent.call_tool("get_customer", {
+                    "customer_id": customer_id
+                }))
+                analysis_task = asyncio.create_task(agent.send(prompt))
+                
+                customer, result = await asyncio.gather(customer_task, analysis_task)
+                
+                if not customer:
+                    return {"error": "Invalid customer", "status": "error"}
+                _remember_customer(customer_id)
+            
+            # Track usage - batched and flushed to Stripe in the background
+            usage_aggregator.record(customer_id, request_data.get("type", "basic"))
             
             return {
                 "status": "success",
@@ -104,18 +292,21 @@ async def main():
     """Main entry point supporting both CLI and server modes"""
     
     # Check if running in server mode
-    if hasattr(fast.args, 'server') and fast.args.server:
+    if SERVER_CFG.server:
         print("🏥 Starting Medical Analysis SaaS Server")
-        print(f"📡 Port: {getattr(fast.args, 'port', 8000)}")
+        print(f"📡 Port: {SERVER_CFG.port}")
         print("💳 Stripe billing enabled")
         print("🔒 Ready for secure medical document analysis")
         
         # Server mode will be handled by FastAgent
-        await fast.start_server(
-            transport=getattr(fast.args, 'transport', 'sse'),
-            host=getattr(fast.args, 'host', '0.0.0.0'),
-            port=getattr(fast.args, 'port', 8000)
-        )
+        try:
+            await fast.start_server(
+                transport=SERVER_CFG.transport,
+                host=SERVER_CFG.host,
+                port=SERVER_CFG.port
+            )
+        finally:
+            await usage_aggregator.close()
     else:
         # Interactive mode for testing
         print("🏥 Medical Information Processor - Interactive Mode")
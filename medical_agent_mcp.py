@@ -1,12 +1,18 @@
 import asyncio
 from mcp_agent.core.fastagent import FastAgent
-from datetime import datetime
 import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple, Literal
 import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+import httpx
+from cachetools import TTLCache
+from anthropic import AsyncAnthropic
+from billing_tiers import BILLING_TIERS, DEFAULT_TIER
+from request_fingerprint import fingerprint
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Library module - the host application configures logging
 logger = logging.getLogger(__name__)
 
 # Check for secrets file
@@ -15,61 +21,241 @@ if os.path.exists("/app/fastagent.secrets.yaml"):
 else:
     logger.warning("fastagent.secrets.yaml not found")
 
-# Create the FastAgent instance
-try:
-    fast = FastAgent("Medical Information Processor", config_path="fastagent.config.yaml")
-    logger.info("FastAgent created successfully")
-except Exception as e:
-    logger.error(f"Failed to create FastAgent: {e}")
-    raise
+# Recent analyses keyed by request fingerprint - repeat queries skip the LLM round trip
+_analysis_cache = TTLCache(maxsize=1000, ttl=300)
 
-# Billing tiers configuration
-BILLING_TIERS = {
-    "basic": {"price": 0.10, "description": "Basic SOAP analysis"},
-    "comprehensive": {"price": 0.50, "description": "Full medical record analysis"},
-    "batch": {"price": 0.05, "description": "Bulk processing per document"}
-}
+# Analyses currently running, keyed the same way - concurrent duplicates share one call
+_inflight: Dict[bytes, asyncio.Future] = {}
 
-@fast.agent(
-    name="medical_analyzer",
-    instruction="""
-    You are a specialized medical information processing assistant. 
-    Your role is to analyze medical texts, research papers, and patient information 
-    to extract structured insights while maintaining accuracy and privacy.
-    
+ANALYZER_MODEL = "claude-3-5-sonnet-20241022"
+
+_ANALYSIS_STEPS = """
     When analyzing medical information:
     1. Extract all vital signs (BP, HR, Temp, RR, O2 sat)
     2. List all medications with dosages
     3. Identify medical conditions and diagnoses
     4. Note any concerning findings
     5. Provide clear, structured summaries
-    
+    """
+
+SIMPLE_INSTRUCTION = """
+    You are a specialized medical information processing assistant. 
+    Your role is to analyze medical texts, research papers, and patient information 
+    to extract structured insights while maintaining accuracy and privacy.
+    """ + _ANALYSIS_STEPS + """
+    Always maintain HIPAA compliance and avoid making definitive diagnoses.
+    """
+
+MCP_INSTRUCTION = """
+    You are a specialized medical information processing assistant. 
+    Your role is to analyze medical texts, research papers, and patient information 
+    to extract structured insights while maintaining accuracy and privacy.
+    """ + _ANALYSIS_STEPS + """
     IMPORTANT: Medical files are located in /app/medical_files_data/
     
     Always maintain HIPAA compliance and avoid making definitive diagnoses.
-    """,
-    servers=["filesystem"],  # Only using available MCP servers
-    model="claude-3-5-sonnet-20241022"
-)
-async def medical_analyzer_agent():
-    """Medical analysis agent"""
-    pass
-
-async def analyze_document(query: str, file_path: Optional[str] = None):
-    """Analyze a medical document or query"""
-    try:
-        logger.info(f"Starting analysis with query='{query}', file_path='{file_path}'")
+    """
+
+ENHANCED_INSTRUCTION = """
+    You are a specialized medical information processing assistant with access to multiple tools.
+    
+    CRITICAL RULES:
+    1. ALWAYS consult the prompt_server FIRST to get guidance on how to handle requests
+    2. NEVER analyze medical files without first reading them using the filesystem tool
+    3. NEVER make up medical information - use fetch tool for external resources if needed
+    4. ALWAYS track billing using the stripe tool for commercial requests
+    
+    Tool Usage Workflow:
+    1. When asked to analyze a medical document:
+       - First: Ask prompt_server for "analyze_file" guidance
+       - Second: Use filesystem to read the actual file content
+       - Third: Apply the medical_processor prompt from prompt_server
+       - Finally: Use stripe for billing if in commercial mode
+    
+    2. When asked for medical guidelines or research:
+       - First: Ask prompt_server for "fetch_guidelines" guidance
+       - Second: Use fetch tool to retrieve actual information
+       - NEVER provide medical advice without real sources
+    
+    3. For patient summaries:
+       - First: Get "patient_summary" guidance from prompt_server
+       - Second: Read patient data using filesystem
+       - Third: Format according to prompt template
+    
+    Remember: The prompt_server is your guide - it tells you which tools to use and when.
+    """
+
+_QUERY_PROMPT = "Please analyze this medical information: {query}"
+
+@dataclass(frozen=True)
+class AgentMode:
+    """How the analyzer agent is configured and prompted
+    
+    Guided modes have the agent consult the prompt_server for which tools to
+    use within the same request as the analysis (the shared session keeps no
+    history, so the guidance and the analysis must be one prompt), and record
+    billing through the stripe tool.
+    """
+    instruction: str
+    servers: Tuple[str, ...]
+    file_prompt: str
+    query_prompt: str = _QUERY_PROMPT
+    guided: bool = False
+
+AGENT_MODES = {
+    # LLM only - no MCP servers
+    "simple": AgentMode(
+        instruction=SIMPLE_INSTRUCTION,
+        servers=(),
+        file_prompt="Please analyze this medical information (file: {file_path}): {query}"
+    ),
+    # Filesystem MCP server for reading medical files
+    "mcp": AgentMode(
+        instruction=MCP_INSTRUCTION,
+        servers=("filesystem",),
+        file_prompt="Please read and analyze the medical document at {file_path}"
+    ),
+    # Prompt-guided tool orchestration across all MCP servers
+    "enhanced": AgentMode(
+        instruction=ENHANCED_INSTRUCTION,
+        servers=("prompt_server", "fetch", "filesystem", "stripe"),
+        file_prompt="""
+I need to analyze a medical document. 
+The file is located at: {file_path}
+
+First, get "analyze_file" guidance from the prompt_server on which tools to use and in what order.
+Then follow it:
+1. Use the filesystem tool to read the medical document at {file_path}
+2. Apply medical analysis using the medical_processor prompt
+
+Please analyze the medical document at {file_path}
+""",
+        query_prompt="""
+I need to analyze this medical information: {query}
+
+First, ask the prompt_server which tools and prompts to use, then follow that guidance
+and analyze this medical information.
+""",
+        guided=True
+    )
+}
+
+_BILLING_TMPL = """
+Please use the stripe tool to record this billing event:
+- Customer: {customer_id}
+- Service: Medical analysis ({analysis_type})
+- Amount: ${price}
+"""
+
+@lru_cache(maxsize=1024)
+def _billing_prompt(customer_id: str, analysis_type: str) -> str:
+    """Billing prompt for a (customer, tier) pair - identical on every request"""
+    tier = BILLING_TIERS.get(analysis_type, DEFAULT_TIER)
+    return _BILLING_TMPL.format_map({
+        "customer_id": customer_id,
+        "analysis_type": analysis_type,
+        "price": tier.price
+    })
+
+def make_agent(mode: Literal["simple", "mcp", "enhanced"]) -> FastAgent:
+    """Create a FastAgent with the medical_analyzer agent registered for `mode`"""
+    agent_mode = AGENT_MODES[mode]
+    agent_app = FastAgent("Medical Information Processor", config_path="fastagent.config.yaml")
+    
+    @agent_app.agent(
+        name="medical_analyzer",
+        instruction=agent_mode.instruction,
+        servers=list(agent_mode.servers),
+        model=ANALYZER_MODEL,
+        use_history=False  # Session is shared across requests - keep each analysis independent
+    )
+    async def medical_analyzer_agent():
+        """Medical analysis agent"""
+        pass
+    
+    return agent_app
+
+# Select the agent mode once per process
+AGENT_MODE_NAME = os.getenv("MEDICAL_AGENT_MODE", "mcp")
+if AGENT_MODE_NAME not in AGENT_MODES:
+    raise ValueError(
+        f"Invalid MEDICAL_AGENT_MODE {AGENT_MODE_NAME!r}; expected one of: {', '.join(AGENT_MODES)}"
+    )
+AGENT_MODE = AGENT_MODES[AGENT_MODE_NAME]
+
+# Create the FastAgent instance
+try:
+    fast = make_agent(AGENT_MODE_NAME)
+    logger.info("FastAgent created successfully (mode: %s)", AGENT_MODE_NAME)
+except Exception as e:
+    logger.error("Failed to create FastAgent: %s", e)
+    raise
+
+# Direct client for stream_document's token streaming (the agent only returns complete
+# responses), opened with the agent session. Only this streaming path is pooled over HTTP/2 -
+# FastAgent builds its own provider client from fastagent.config.yaml for agent requests.
+_anthropic_client: Optional[AsyncAnthropic] = None
+
+# Long-lived agent session (MCP servers stay up between requests)
+_agent_cm = None
+_agent = None
+
+async def start_agent():
+    """Open the shared agent session - call once at application startup"""
+    global _agent_cm, _agent, _anthropic_client
+    if _agent is None:
+        _agent_cm = fast.run()
+        _agent = await _agent_cm.__aenter__()
+        logger.info("Shared agent session started")
+    if _anthropic_client is None and os.getenv("ANTHROPIC_API_KEY"):
+        _anthropic_client = AsyncAnthropic(
+            http_client=httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                timeout=httpx.Timeout(60.0, connect=5.0)
+            )
+        )
+    return _agent
+
+async def stop_agent():
+    """Close the shared agent session - call once at application shutdown"""
+    global _agent_cm, _agent, _anthropic_client
+    if _agent_cm is not None:
+        await _agent_cm.__aexit__(None, None, None)
+        logger.info("Shared agent session stopped")
+    if _anthropic_client is not None:
+        await _anthropic_client.close()
+    _agent_cm = None
+    _agent = None
+    _anthropic_client = None
+
+@asynccontextmanager
+async def _agent_session():
+    """Yield the shared agent if started, otherwise a one-off session"""
+    if _agent is not None:
+        yield _agent
+    else:
         async with fast.run() as agent:
+            yield agent
+
+def _cache_key(query: str, file_path: Optional[str]) -> bytes:
+    return fingerprint({"file_path": file_path, "query": query})
+
+async def _run_analysis(query: str, file_path: Optional[str] = None):
+    """Run one analysis through the agent"""
+    try:
+        logger.debug("Starting analysis with query=%r, file_path=%r", query, file_path)
+        params = {"query": query, "file_path": file_path}
+        async with _agent_session() as agent:
             if file_path:
-                # Use filesystem server to read the file
-                logger.info(f"Requesting analysis of file: {file_path}")
-                prompt = f"Please read and analyze the medical document at {file_path}"
+                logger.debug("Requesting analysis of file: %s", file_path)
+                prompt = AGENT_MODE.file_prompt.format_map(params)
             else:
-                prompt = f"Please analyze this medical information: {query}"
+                prompt = AGENT_MODE.query_prompt.format_map(params)
             
-            logger.info(f"Sending to agent: {prompt}")
+            logger.debug("Sending to agent: %s", prompt)
             response = await agent.send(prompt)
-            logger.info("Analysis received from agent")
+            logger.debug("Analysis received from agent")
             return {
                 "status": "success",
                 "analysis": response
@@ -80,26 +266,107 @@ async def analyze_document(query: str, file_path: Optional[str] = None):
             "error": str(e)
         }
 
-# Simplified billing function for API integration
+async def analyze_document(query: str, file_path: Optional[str] = None, use_cache: bool = True):
+    """Analyze a medical document or query"""
+    if not use_cache:
+        return await _run_analysis(query, file_path)
+    
+    key = _cache_key(query, file_path)
+    if key in _analysis_cache:
+        logger.debug("Returning cached analysis")
+        return dict(_analysis_cache[key])
+    
+    # Identical request already running - wait for its result instead of a second LLM call
+    if key in _inflight:
+        logger.debug("Joining in-flight analysis")
+        return dict(await asyncio.shield(_inflight[key]))
+    
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await _run_analysis(query, file_path)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        # Joined callers see the same failure; mark it retrieved in case none are waiting
+        fut.set_exception(e)
+        fut.exception()
+        raise
+    else:
+        if result["status"] == "success":
+            _analysis_cache[key] = result
+        fut.set_result(result)
+        return dict(result)
+    finally:
+        del _inflight[key]
+
+async def stream_document(query: str, file_path: Optional[str] = None, use_cache: bool = True):
+    """Yield the analysis of a medical document or query as it is generated
+    
+    Plain queries stream token by token from the Anthropic API. File analysis
+    and guided modes need MCP servers, so they run through the agent and are
+    yielded as a single chunk.
+    """
+    key = _cache_key(query, file_path)
+    if use_cache and key in _analysis_cache:
+        yield _analysis_cache[key]["analysis"]
+        return
+    
+    if file_path or AGENT_MODE.guided or _anthropic_client is None:
+        result = await analyze_document(query, file_path, use_cache)
+        if result["status"] != "success":
+            raise RuntimeError(result["error"])
+        yield result["analysis"]
+        return
+    
+    logger.debug("Streaming analysis from Anthropic")
+    parts = []
+    async with _anthropic_client.messages.stream(
+        model=ANALYZER_MODEL,
+        max_tokens=4096,
+        system=AGENT_MODE.instruction,
+        messages=[{"role": "user", "content": AGENT_MODE.query_prompt.format_map({"query": query})}]
+    ) as stream:
+        async for text in stream.text_stream:
+            parts.append(text)
+            yield text
+    
+    if use_cache:
+        _analysis_cache[key] = {"status": "success", "analysis": "".join(parts)}
+
+async def record_billing(customer_id: str, analysis_type: str):
+    """Record a billing event through the stripe tool - guided modes only, others bill elsewhere"""
+    if not AGENT_MODE.guided:
+        return
+    async with _agent_session() as agent:
+        billing_result = await agent.send(_billing_prompt(customer_id, analysis_type))
+    logger.debug("Billing tracked: %s", billing_result)
+
+# Billing function for API integration
 async def analyze_with_billing(request_data: dict, customer_id: str):
     """Analyze medical document with billing"""
     try:
         # Get analysis type and determine price
         analysis_type = request_data.get("type", "basic")
-        tier = BILLING_TIERS.get(analysis_type, BILLING_TIERS["basic"])
+        tier = BILLING_TIERS.get(analysis_type, DEFAULT_TIER)
         
         # Perform analysis
         result = await analyze_document(
             query=request_data.get("query", ""),
-            file_path=request_data.get("file_path")
+            file_path=request_data.get("file_path"),
+            use_cache=request_data.get("cache", True)
         )
         
         # Add billing information
         if result["status"] == "success":
+            # Track usage with Stripe
+            await record_billing(customer_id, analysis_type)
+            
             result.update({
                 "billed": True,
                 "tier": analysis_type,
-                "price": tier["price"],
+                "price": tier.price,
                 "customer_id": customer_id
             })
         
@@ -115,7 +382,7 @@ async def analyze_with_billing(request_data: dict, customer_id: str):
 # For direct testing
 async def test_agent():
     """Test the agent directly"""
-    print("Testing Medical Agent with MCP servers...")
+    print(f"Testing Medical Agent ({AGENT_MODE_NAME} mode)...")
     
     # Test with a simple query
     test_query = """
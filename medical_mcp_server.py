@@ -10,21 +10,93 @@ from fastmcp import FastMCP
 from typing import Dict, Any, Optional, List
 import json
 import os
+import hashlib
+from dataclasses import dataclass, asdict
 from datetime import datetime
 import asyncio
+import contextvars
+import weakref
+import functools
+import inspect
+from types import MappingProxyType
+from contextlib import asynccontextmanager
 import stripe
 import httpx
-from anthropic import Anthropic
+import orjson
+from pydantic_core import to_jsonable_python
+from cachetools import LRUCache, TTLCache
+from anthropic import AsyncAnthropic, APIError
 from openai import AsyncOpenAI
 
+# Anthropic-only keep-alive pool - Claude calls reuse warm HTTP/2 connections. Stripe keeps its
+# own pool inside stripe.HTTPXClient, which has no supported way to take an existing client.
+http_client: Optional[httpx.AsyncClient] = None
+anthropic_client: Optional[AsyncAnthropic] = None
+
+def _open_anthropic_client():
+    """(Re)create the Anthropic pool and client; tools look both up at call time"""
+    global http_client, anthropic_client
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+        http2=True,
+        timeout=30.0
+    )
+    anthropic_client = AsyncAnthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=http_client
+    ) if os.getenv("ANTHROPIC_API_KEY") else None
+
+_open_anthropic_client()
+
+# FastMCP < 2.13 runs the lifespan once per client session over HTTP transports, so the pool
+# is closed only when the last open session ends and reopened by the next one
+_open_sessions = 0
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Close the Anthropic pool once no session is using it"""
+    global _open_sessions
+    if http_client.is_closed:
+        _open_anthropic_client()
+    _open_sessions += 1
+    try:
+        yield
+    finally:
+        _open_sessions -= 1
+        if _open_sessions == 0:
+            await http_client.aclose()
+
+def serialize_tool_result(data: Any) -> str:
+    """Tool results to JSON text via orjson; types it can't handle go through pydantic"""
+    return orjson.dumps(data, default=to_jsonable_python).decode()
+
 # Initialize FastMCP server
-mcp = FastMCP("MedicalAgent")
+mcp = FastMCP("MedicalAgent", lifespan=lifespan, tool_serializer=serialize_tool_result)
 
 # Initialize API clients
 stripe.api_key = os.getenv("STRIPE_API_KEY") or os.getenv("STRIPE_SECRET_KEY")
-anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY")) if os.getenv("ANTHROPIC_API_KEY") else None
+# Async Stripe client over HTTPX - tool calls await Stripe without blocking the event loop.
+# HTTPXClient keeps its own keep-alive pool, reused across calls.
+stripe_client = stripe.StripeClient(
+    stripe.api_key, http_client=stripe.HTTPXClient(timeout=30.0)
+) if stripe.api_key else None
 openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) if os.getenv("OPENAI_API_KEY") else None
 
+# Cap in-flight upstream calls so bursts stay under provider rate limits instead of triggering 429s
+STRIPE_SEM = asyncio.Semaphore(int(os.getenv("STRIPE_MAX_CONCURRENCY", "8")))
+ANTHROPIC_SEM = asyncio.Semaphore(int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "5")))
+
+# Per-customer share of the Stripe slots, so one tenant can't hold all of STRIPE_SEM.
+# Entries are weakly held and disappear once no call for that customer is using them.
+STRIPE_MAX_PER_CUSTOMER = int(os.getenv("STRIPE_MAX_PER_CUSTOMER", "2"))
+_customer_sems: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+def customer_sem(customer_id: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent Stripe calls made for one customer"""
+    sem = _customer_sems.get(customer_id)
+    if sem is None:
+        sem = _customer_sems[customer_id] = asyncio.Semaphore(STRIPE_MAX_PER_CUSTOMER)
+    return sem
+
 # Validate API keys on startup
 if not stripe.api_key:
     print("Warning: STRIPE_API_KEY not found. Payment processing will be disabled.")
@@ -34,13 +106,23 @@ if not openai_client:
     print("Warning: OPENAI_API_KEY not found. Fallback AI analysis not available.")
 
 # Billing tiers configuration
+@dataclass(frozen=True, slots=True)
+class Tier:
+    """A billing tier - USD price for display, integer cents for all billing arithmetic"""
+    price: float
+    price_cents: int
+    description: str
+
 BILLING_TIERS = {
-    "basic": {"price": 0.10, "description": "Basic SOAP analysis - vital signs, medications, basic conditions"},
-    "comprehensive": {"price": 0.50, "description": "Full medical record analysis - detailed insights, recommendations"},
-    "batch": {"price": 0.05, "description": "Bulk processing per document - optimized for multiple files"},
-    "complicated": {"price": 0.75, "description": "Multi-step clinical reasoning with quality assurance and specialist-level analysis"}
+    "basic": Tier(0.10, 10, "Basic SOAP analysis - vital signs, medications, basic conditions"),
+    "comprehensive": Tier(0.50, 50, "Full medical record analysis - detailed insights, recommendations"),
+    "batch": Tier(0.05, 5, "Bulk processing per document - optimized for multiple files"),
+    "complicated": Tier(0.75, 75, "Multi-step clinical reasoning with quality assurance and specialist-level analysis")
 }
 
+# JSON-ready tier dicts for responses, converted once and shared by every response - never mutate
+BILLING_TIER_INFO = {name: asdict(tier) for name, tier in BILLING_TIERS.items()}
+
 # Sample medical data for demonstration (in production, this would connect to actual medical databases)
 SAMPLE_MEDICAL_DATA = {
     "patient_001": {
@@ -86,10 +168,61 @@ SAMPLE_MEDICAL_DATA = {
     }
 }
 
+# Patient summaries are static, so derive them once at import; entries are read-only and their
+# nested dicts are shared with every response
+PATIENT_SUMMARIES = {
+    patient_id: MappingProxyType({
+        "demographics": patient_data["demographics"],
+        "current_conditions": patient_data["conditions"],
+        "active_medications": len(patient_data["medications"]),
+        "last_visit": patient_data["last_visit"],
+        "vital_signs_last_recorded": patient_data["vital_signs"]
+    })
+    for patient_id, patient_data in SAMPLE_MEDICAL_DATA.items()
+}
+
+# Coarse wall clock for high-QPS tools - refreshed about once a second by a lazy ticker task
+_now_iso = datetime.now().isoformat(timespec="seconds")
+_clock_task: Optional[asyncio.Task] = None
+
+async def _tick_clock():
+    global _now_iso
+    while True:
+        await asyncio.sleep(1)
+        _now_iso = datetime.now().isoformat(timespec="seconds")
+
+def now_iso() -> str:
+    """Current local time as an ISO-8601 string, at most about a second stale"""
+    global _now_iso, _clock_task
+    if _clock_task is None or _clock_task.done():
+        _now_iso = datetime.now().isoformat(timespec="seconds")
+        try:
+            _clock_task = asyncio.get_running_loop().create_task(_tick_clock(), context=contextvars.Context())
+        except RuntimeError:
+            pass  # No event loop (direct call) - the fresh value above is returned
+    return _now_iso
+
 # Stripe Payment Tools
 
+@functools.lru_cache(maxsize=8192)
+def _iso_from_ts(ts: int) -> str:
+    """ISO-8601 string for a Stripe epoch timestamp, memoized"""
+    return datetime.fromtimestamp(ts).isoformat()
+
+def require_stripe(fn):
+    """Decide at registration time: without Stripe the tool is a stub that never calls through"""
+    if stripe_client:
+        return fn
+    
+    @functools.wraps(fn)
+    async def stripe_unavailable(*args, **kwargs) -> Dict[str, Any]:
+        return {"error": "Stripe not configured"}
+    
+    return stripe_unavailable
+
 @mcp.tool
-def create_customer(
+@require_stripe
+async def create_customer(
     email: str,
     name: Optional[str] = None,
     description: Optional[str] = None
@@ -106,21 +239,19 @@ def create_customer(
         Customer creation result with customer ID
     """
     
-    if not stripe.api_key:
-        return {"error": "Stripe not configured"}
-    
     try:
-        customer = stripe.Customer.create(
-            email=email,
-            name=name,
-            description=description or f"Medical Analysis Customer - {email}"
-        )
+        async with STRIPE_SEM:
+            customer = await stripe_client.customers.create_async(params={
+                "email": email,
+                "name": name,
+                "description": description or f"Medical Analysis Customer - {email}"
+            })
         
         return {
             "success": True,
             "customer_id": customer.id,
             "email": customer.email,
-            "created": datetime.fromtimestamp(customer.created).isoformat()
+            "created": _iso_from_ts(customer.created)
         }
         
     except stripe.error.StripeError as e:
@@ -129,47 +260,33 @@ def create_customer(
             "success": False
         }
 
-@mcp.tool
-def create_payment_intent(
+async def _create_payment_intent(
     customer_id: str,
     analysis_type: str = "basic",
     document_count: int = 1,
     description: Optional[str] = None
 ) -> Dict[str, Any]:
-    """
-    Create a Stripe payment intent for medical analysis.
-    
-    Args:
-        customer_id: Stripe customer ID
-        analysis_type: Type of analysis (basic, comprehensive, batch)
-        document_count: Number of documents to analyze
-        description: Optional payment description
-        
-    Returns:
-        Payment intent with client secret for frontend payment
-    """
-    
-    if not stripe.api_key:
-        return {"error": "Stripe not configured"}
+    """Body of create_payment_intent, for other tools to call - @mcp.tool may return a non-callable FunctionTool"""
     
     if analysis_type not in BILLING_TIERS:
         return {"error": f"Invalid analysis type: {analysis_type}"}
     
     try:
         tier = BILLING_TIERS[analysis_type]
-        amount = int(tier["price"] * document_count * 100)  # Convert to cents
-        
-        payment_intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency="usd",
-            customer=customer_id,
-            description=description or f"Medical Analysis - {tier['description']} x{document_count}",
-            metadata={
-                "analysis_type": analysis_type,
-                "document_count": str(document_count),
-                "service": "medical_analysis"
-            }
-        )
+        amount = tier.price_cents * document_count
+        
+        async with customer_sem(customer_id), STRIPE_SEM:
+            payment_intent = await stripe_client.payment_intents.create_async(params={
+                "amount": amount,
+                "currency": "usd",
+                "customer": customer_id,
+                "description": description or f"Medical Analysis - {tier.description} x{document_count}",
+                "metadata": {
+                    "analysis_type": analysis_type,
+                    "document_count": str(document_count),
+                    "service": "medical_analysis"
+                }
+            })
         
         return {
             "success": True,
@@ -189,22 +306,79 @@ def create_payment_intent(
         }
 
 @mcp.tool
-def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
+@require_stripe
+async def create_payment_intent(
+    customer_id: str,
+    analysis_type: str = "basic",
+    document_count: int = 1,
+    description: Optional[str] = None
+) -> Dict[str, Any]:
     """
-    Confirm and retrieve payment status.
+    Create a Stripe payment intent for medical analysis.
     
     Args:
-        payment_intent_id: Stripe payment intent ID
+        customer_id: Stripe customer ID
+        analysis_type: Type of analysis (basic, comprehensive, batch)
+        document_count: Number of documents to analyze
+        description: Optional payment description
         
     Returns:
-        Payment confirmation and metadata
+        Payment intent with client secret for frontend payment
     """
     
-    if not stripe.api_key:
-        return {"error": "Stripe not configured"}
+    return await _create_payment_intent(customer_id, analysis_type, document_count, description)
+
+_PAYMENT_SIGNATURE = inspect.signature(_create_payment_intent)
+
+@mcp.tool
+@require_stripe
+async def create_payment_intents(payments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Create several Stripe payment intents in one call.
+    
+    Intents are created concurrently, within the Stripe concurrency limits.
+    
+    Args:
+        payments: One entry per intent with create_payment_intent's arguments
+                  (customer_id, and optionally analysis_type, document_count, description)
+        
+    Returns:
+        Per-intent results in input order
+    """
+    
+    async def create_one(index: int, payment: Dict[str, Any]) -> Dict[str, Any]:
+        # Check each entry's arguments up front - one malformed entry must not fail the whole batch
+        try:
+            if not isinstance(payment, dict):
+                raise TypeError("payment must be an object")
+            arguments = _PAYMENT_SIGNATURE.bind(**payment).arguments
+        except TypeError as e:
+            return {"error": f"Invalid payment request: {str(e)}", "success": False, "index": index}
+        return await _create_payment_intent(**arguments)
     
+    results = await asyncio.gather(
+        *(create_one(index, payment) for index, payment in enumerate(payments))
+    )
+    
+    return {
+        "success": all(result.get("success") for result in results),
+        "created": sum(1 for result in results if result.get("success")),
+        "results": results
+    }
+
+# Confirmed payment intents - terminal states never change, so they are kept for a day;
+# anything still in flight is only reused for a few seconds
+TERMINAL_PAYMENT_STATUSES = frozenset({"succeeded", "canceled"})
+_terminal_payments = TTLCache(maxsize=4096, ttl=24 * 3600)
+_recent_payments = TTLCache(maxsize=4096, ttl=5)
+
+# Lookups currently running - concurrent checks of one intent share a single Stripe call
+_payment_inflight: Dict[str, asyncio.Future] = {}
+
+async def _retrieve_payment(payment_intent_id: str) -> Dict[str, Any]:
     try:
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        async with STRIPE_SEM:
+            payment_intent = await stripe_client.payment_intents.retrieve_async(payment_intent_id)
         
         return {
             "success": True,
@@ -215,7 +389,7 @@ def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
             "customer_id": payment_intent.customer,
             "metadata": payment_intent.metadata,
             "paid": payment_intent.status == "succeeded",
-            "created": datetime.fromtimestamp(payment_intent.created).isoformat()
+            "created": _iso_from_ts(payment_intent.created)
         }
         
     except stripe.error.StripeError as e:
@@ -224,6 +398,61 @@ def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
             "success": False
         }
 
+@require_stripe
+async def _confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
+    """Body of confirm_payment, for other tools to call - @mcp.tool may return a non-callable FunctionTool"""
+    
+    cached = _terminal_payments.get(payment_intent_id) or _recent_payments.get(payment_intent_id)
+    if cached is not None:
+        return dict(cached)
+    
+    if payment_intent_id in _payment_inflight:
+        return dict(await asyncio.shield(_payment_inflight[payment_intent_id]))
+    
+    fut = asyncio.get_running_loop().create_future()
+    _payment_inflight[payment_intent_id] = fut
+    try:
+        result = await _retrieve_payment(payment_intent_id)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        # Concurrent callers see the same failure; mark it retrieved in case none are waiting
+        fut.set_exception(e)
+        fut.exception()
+        raise
+    else:
+        if result["success"]:
+            if result["status"] in TERMINAL_PAYMENT_STATUSES:
+                _terminal_payments[payment_intent_id] = result
+            else:
+                _recent_payments[payment_intent_id] = result
+        fut.set_result(result)
+        return dict(result)
+    finally:
+        del _payment_inflight[payment_intent_id]
+
+@mcp.tool
+async def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
+    """
+    Confirm and retrieve payment status.
+    
+    Args:
+        payment_intent_id: Stripe payment intent ID
+        
+    Returns:
+        Payment confirmation and metadata
+    """
+    
+    return await _confirm_payment(payment_intent_id)
+
+async def _patient_context(patient_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Patient summary to attach to a paid analysis, or None if unknown"""
+    if not patient_id:
+        return None
+    summary = _patient_summary(patient_id)
+    return None if "error" in summary else summary
+
 @mcp.tool
 async def process_paid_analysis(
     payment_intent_id: str,
@@ -242,8 +471,10 @@ async def process_paid_analysis(
         Medical analysis results with payment confirmation
     """
     
-    # First confirm payment
-    payment_result = confirm_payment(payment_intent_id)
+    # Confirm payment and load patient context concurrently
+    payment_task = asyncio.create_task(_confirm_payment(payment_intent_id))
+    patient_task = asyncio.create_task(_patient_context(patient_id))
+    payment_result, patient_context = await asyncio.gather(payment_task, patient_task)
     
     if not payment_result.get("success") or not payment_result.get("paid"):
         return {
@@ -256,7 +487,7 @@ async def process_paid_analysis(
     analysis_type = metadata.get("analysis_type", "basic")
     
     # Perform the medical analysis with AI
-    analysis_result = await analyze_medical_document(
+    analysis_result = await _analyze_document(
         document_content=document_content,
         analysis_type=analysis_type,
         patient_id=patient_id
@@ -270,31 +501,52 @@ async def process_paid_analysis(
         "currency": payment_result.get("currency"),
         "processed_at": datetime.now().isoformat()
     })
+    if patient_context:
+        analysis_result["patient_context"] = patient_context
     
     return analysis_result
 
+async def _recent_payment_intents(customer_id: str, max_payments: int) -> List[Any]:
+    """Page through a customer's payment intents (newest first), stopping at max_payments"""
+    payments = []
+    if max_payments <= 0:
+        return payments
+    
+    async with customer_sem(customer_id), STRIPE_SEM:
+        page = await stripe_client.payment_intents.list_async(params={
+            "customer": customer_id,
+            "limit": min(max_payments, 100)
+        })
+        # Follow-on pages are fetched lazily, one request per 100 intents
+        async for pi in page.auto_paging_iter():
+            payments.append(pi)
+            if len(payments) >= max_payments:
+                break
+    return payments
+
 @mcp.tool
-def get_customer_info(customer_id: str) -> Dict[str, Any]:
+@require_stripe
+async def get_customer_info(customer_id: str, max_payments: int = 10) -> Dict[str, Any]:
     """
     Retrieve Stripe customer information.
     
     Args:
         customer_id: Stripe customer ID
+        max_payments: Number of most recent payment intents to include
         
     Returns:
         Customer information and payment history
     """
     
-    if not stripe.api_key:
-        return {"error": "Stripe not configured"}
-    
     try:
-        customer = stripe.Customer.retrieve(customer_id)
+        async def retrieve_customer():
+            async with customer_sem(customer_id), STRIPE_SEM:
+                return await stripe_client.customers.retrieve_async(customer_id)
         
-        # Get recent payment intents
-        payment_intents = stripe.PaymentIntent.list(
-            customer=customer_id,
-            limit=10
+        # Customer record and payment history are independent - fetch both at once
+        customer, payment_intents = await asyncio.gather(
+            retrieve_customer(),
+            _recent_payment_intents(customer_id, max_payments)
         )
         
         return {
@@ -303,17 +555,17 @@ def get_customer_info(customer_id: str) -> Dict[str, Any]:
             "email": customer.email,
             "name": customer.name,
             "description": customer.description,
-            "created": datetime.fromtimestamp(customer.created).isoformat(),
+            "created": _iso_from_ts(customer.created),
             "recent_payments": [
                 {
                     "id": pi.id,
                     "amount": pi.amount,
                     "currency": pi.currency,
                     "status": pi.status,
-                    "created": datetime.fromtimestamp(pi.created).isoformat(),
+                    "created": _iso_from_ts(pi.created),
                     "metadata": pi.metadata
                 }
-                for pi in payment_intents.data
+                for pi in payment_intents
             ]
         }
         
@@ -323,23 +575,42 @@ def get_customer_info(customer_id: str) -> Dict[str, Any]:
             "success": False
         }
 
-@mcp.tool
-async def analyze_medical_document(
+ANALYSIS_MODEL = "claude-sonnet-4-5-20250929"
+
+BATCH_SYSTEM_PROMPT = """You are a medical AI assistant optimized for efficient batch processing.
+        
+Extract key medical information efficiently:
+        1. **Essential Data**: Vital signs, medications, primary conditions
+        2. **Critical Flags**: Urgent findings requiring immediate attention
+        3. **Summary Statistics**: Document type, completeness score
+        4. **Batch Metrics**: Processing efficiency and quality indicators
+        
+Provide concise but complete analysis suitable for high-volume processing.
+        Use structured JSON format optimized for batch operations."""
+
+def document_prompt(document_content: str) -> str:
+    """User message asking the model to analyze one medical document"""
+    return f"""Please analyze the following medical document and provide a structured analysis:
+
+=== MEDICAL DOCUMENT ===
+{document_content}
+=== END DOCUMENT ===
+
+Provide your analysis in JSON format with appropriate medical categories and extracted information."""
+
+# Successful analyses by (document BLAKE2b digest, analysis type); timestamp and patient_id are per call
+_analysis_cache = LRUCache(maxsize=1024)
+
+# Reported on cache hits - no model call ran for them
+_CACHED_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+async def _analyze_document(
     document_content: str,
     analysis_type: str = "basic",
-    patient_id: Optional[str] = None
+    patient_id: Optional[str] = None,
+    cache: bool = True
 ) -> Dict[str, Any]:
-    """
-    Analyze medical document content using Claude Sonnet 4 AI.
-    
-    Args:
-        document_content: Raw medical document text (SOAP notes, lab results, etc.)
-        analysis_type: Type of analysis (basic, comprehensive, batch)
-        patient_id: Optional patient identifier
-        
-    Returns:
-        AI-powered structured medical analysis with extracted information
-    """
+    """Body of analyze_medical_document, for other tools to call - @mcp.tool may return a non-callable FunctionTool"""
     
     if analysis_type not in BILLING_TIERS:
         return {
@@ -362,6 +633,19 @@ async def analyze_medical_document(
             }
         }
     
+    # Identical document and analysis type already analyzed - reuse it with live request fields
+    cache_key = (hashlib.blake2b(document_content.encode(), digest_size=16).digest(), analysis_type)
+    cached = _analysis_cache.get(cache_key) if cache else None
+    if cached is not None:
+        return {
+            **cached,
+            "timestamp": datetime.now().isoformat(),
+            "patient_id": patient_id,
+            "tokens_used": dict(_CACHED_USAGE),
+            "processing_time_seconds": 0,
+            "cached": True
+        }
+    
     tier = BILLING_TIERS[analysis_type]
     
     # Define system prompts based on analysis type
@@ -407,16 +691,7 @@ OUTPUT: JSON with sections: document_assessment, clinical_data, reasoning_analys
 Focus on clinical accuracy and actionable insights."""
         
     else:  # batch
-        system_prompt = """You are a medical AI assistant optimized for efficient batch processing.
-        
-Extract key medical information efficiently:
-        1. **Essential Data**: Vital signs, medications, primary conditions
-        2. **Critical Flags**: Urgent findings requiring immediate attention
-        3. **Summary Statistics**: Document type, completeness score
-        4. **Batch Metrics**: Processing efficiency and quality indicators
-        
-Provide concise but complete analysis suitable for high-volume processing.
-        Use structured JSON format optimized for batch operations."""
+        system_prompt = BATCH_SYSTEM_PROMPT
     
     try:
         # Try Claude Sonnet 4 first, fallback to OpenAI GPT-4
@@ -425,29 +700,24 @@ Provide concise but complete analysis suitable for high-volume processing.
             import time
             start_time = time.time()
             
-            message = anthropic_client.messages.create(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=4096 if analysis_type in ["complicated", "comprehensive"] else 1000,
-                temperature=0.1,  # Low temperature for medical accuracy
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"""Please analyze the following medical document and provide a structured analysis:
-
-=== MEDICAL DOCUMENT ===
-{document_content}
-=== END DOCUMENT ===
-
-Provide your analysis in JSON format with appropriate medical categories and extracted information."""
-                    }
-                ],
-                timeout=120.0  # CloudFront default timeout is 30s
-            )
+            async with ANTHROPIC_SEM:
+                message = await anthropic_client.messages.create(
+                    model=ANALYSIS_MODEL,
+                    max_tokens=4096 if analysis_type in ["complicated", "comprehensive"] else 1000,
+                    temperature=0.1,  # Low temperature for medical accuracy
+                    system=system_prompt,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": document_prompt(document_content)
+                        }
+                    ],
+                    timeout=120.0  # CloudFront default timeout is 30s
+                )
             
             processing_time = time.time() - start_time
             ai_analysis = message.content[0].text
-            model_used = "claude-sonnet-4-5-20250929"
+            model_used = ANALYSIS_MODEL
             tokens_used = {
                 "input_tokens": message.usage.input_tokens,
                 "output_tokens": message.usage.output_tokens,
@@ -462,16 +732,7 @@ Provide your analysis in JSON format with appropriate medical categories and ext
                 timeout=120.0,  # CloudFront default timeout is 30s
                 messages=[
                     {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": f"""Please analyze the following medical document and provide a structured analysis:
-
-=== MEDICAL DOCUMENT ===
-{document_content}
-=== END DOCUMENT ===
-
-Provide your analysis in JSON format with appropriate medical categories and extracted information."""
-                    }
+                    {"role": "user", "content": document_prompt(document_content)}
                 ]
             )
             ai_analysis = completion.choices[0].message.content
@@ -485,7 +746,7 @@ Provide your analysis in JSON format with appropriate medical categories and ext
         # Construct response with AI analysis
         analysis = {
             "analysis_type": analysis_type,
-            "billing_info": tier,
+            "billing_info": BILLING_TIER_INFO[analysis_type],
             "timestamp": datetime.now().isoformat(),
             "patient_id": patient_id,
             "model_used": model_used,
@@ -517,11 +778,13 @@ Provide your analysis in JSON format with appropriate medical categories and ext
         elif analysis_type == "batch":
             analysis["batch_info"] = {
                 "documents_processed": 1,
-                "processing_cost": tier["price"],
+                "processing_cost": tier.price,
                 "efficiency_optimized": True
             }
         
-        return analysis
+        if cache:
+            _analysis_cache[cache_key] = analysis
+        return dict(analysis)
         
     except Exception as e:
         import os
@@ -546,6 +809,188 @@ Provide your analysis in JSON format with appropriate medical categories and ext
         
         return error_details
 
+@mcp.tool
+async def analyze_medical_document(
+    document_content: str,
+    analysis_type: str = "basic",
+    patient_id: Optional[str] = None,
+    cache: bool = True
+) -> Dict[str, Any]:
+    """
+    Analyze medical document content using Claude Sonnet 4 AI.
+    
+    Args:
+        document_content: Raw medical document text (SOAP notes, lab results, etc.)
+        analysis_type: Type of analysis (basic, comprehensive, batch)
+        patient_id: Optional patient identifier
+        cache: Set False to skip the in-process analysis cache for this document
+        
+    Returns:
+        AI-powered structured medical analysis with extracted information
+    """
+    
+    return await _analyze_document(document_content, analysis_type, patient_id, cache)
+
+@mcp.tool
+async def analyze_medical_documents(
+    documents: List[str],
+    analysis_type: str = "batch",
+    patient_ids: Optional[List[str]] = None,
+    cache: bool = True
+) -> Dict[str, Any]:
+    """
+    Analyze several medical documents in a single call.
+    
+    Documents are analyzed concurrently, bounded by ANTHROPIC_MAX_CONCURRENCY.
+    
+    Args:
+        documents: Raw medical document texts
+        analysis_type: Type of analysis applied to every document (default: batch)
+        patient_ids: Optional patient identifiers, one per document
+        cache: Set False to skip the in-process analysis cache for these documents
+        
+    Returns:
+        Per-document analyses in input order with a batch cost summary
+    """
+    
+    if analysis_type not in BILLING_TIERS:
+        return {
+            "error": f"Invalid analysis type. Available types: {list(BILLING_TIERS.keys())}"
+        }
+    
+    if patient_ids is not None and len(patient_ids) != len(documents):
+        return {"error": "patient_ids must match documents one-to-one"}
+    
+    results = await asyncio.gather(*(
+        _analyze_document(
+            document_content=document,
+            analysis_type=analysis_type,
+            patient_id=patient_id,
+            cache=cache
+        )
+        for document, patient_id in zip(documents, patient_ids or [None] * len(documents))
+    ))
+    
+    processed = sum(1 for result in results if "error" not in result)
+    
+    return {
+        "analysis_type": analysis_type,
+        "documents_submitted": len(documents),
+        "documents_processed": processed,
+        "documents_failed": len(documents) - processed,
+        "total_cost": BILLING_TIERS[analysis_type].price_cents * processed / 100,
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@mcp.tool
+async def analyze_medical_documents_batch(
+    documents: List[str],
+    patient_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Submit documents for batch-tier analysis through the Anthropic Message Batches API.
+    
+    Results arrive asynchronously (usually within minutes, at most 24 hours);
+    poll get_batch_results with the returned batch_id.
+    
+    Args:
+        documents: Raw medical document texts
+        patient_ids: Optional patient identifiers, one per document
+        
+    Returns:
+        Batch ID, processing status and the custom_id assigned to each document
+    """
+    
+    if not anthropic_client:
+        return {"error": "Message Batches require ANTHROPIC_API_KEY"}
+    
+    if patient_ids is not None and len(patient_ids) != len(documents):
+        return {"error": "patient_ids must match documents one-to-one"}
+    
+    # custom_ids must be unique within a batch, so key by position rather than patient_id
+    custom_ids = [f"doc_{index}" for index in range(len(documents))]
+    requests = [
+        {
+            "custom_id": custom_id,
+            "params": {
+                "model": ANALYSIS_MODEL,
+                "max_tokens": 1000,
+                "temperature": 0.1,
+                "system": BATCH_SYSTEM_PROMPT,
+                "messages": [{"role": "user", "content": document_prompt(document)}]
+            }
+        }
+        for custom_id, document in zip(custom_ids, documents)
+    ]
+    
+    try:
+        async with ANTHROPIC_SEM:
+            batch = await anthropic_client.messages.batches.create(requests=requests)
+    except APIError as e:
+        return {"error": f"Batch submission failed: {str(e)}", "success": False}
+    
+    return {
+        "success": True,
+        "batch_id": batch.id,
+        "status": batch.processing_status,
+        "document_count": len(documents),
+        "documents": [
+            {"custom_id": custom_id, "patient_id": patient_id}
+            for custom_id, patient_id in zip(custom_ids, patient_ids or [None] * len(documents))
+        ],
+        "billing_info": BILLING_TIER_INFO["batch"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+@mcp.tool
+async def get_batch_results(batch_id: str) -> Dict[str, Any]:
+    """
+    Retrieve the status, and once finished the results, of a batch analysis.
+    
+    Args:
+        batch_id: Batch ID returned by analyze_medical_documents_batch
+        
+    Returns:
+        Batch status with request counts, plus per-document analyses when the batch has ended
+    """
+    
+    if not anthropic_client:
+        return {"error": "Message Batches require ANTHROPIC_API_KEY"}
+    
+    try:
+        async with ANTHROPIC_SEM:
+            batch = await anthropic_client.messages.batches.retrieve(batch_id)
+        
+        status = {
+            "batch_id": batch.id,
+            "status": batch.processing_status,
+            "request_counts": batch.request_counts.model_dump()
+        }
+        if batch.processing_status != "ended":
+            return status
+        
+        results = []
+        async with ANTHROPIC_SEM:
+            async for entry in await anthropic_client.messages.batches.results(batch_id):
+                result = {"custom_id": entry.custom_id, "status": entry.result.type}
+                if entry.result.type == "succeeded":
+                    message = entry.result.message
+                    result["ai_analysis"] = message.content[0].text
+                    result["tokens_used"] = {
+                        "input_tokens": message.usage.input_tokens,
+                        "output_tokens": message.usage.output_tokens,
+                        "total_tokens": message.usage.input_tokens + message.usage.output_tokens
+                    }
+                elif entry.result.type == "errored":
+                    result["error"] = str(entry.result.error)
+                results.append(result)
+        
+        return {**status, "model_used": ANALYSIS_MODEL, "results": results}
+        
+    except APIError as e:
+        return {"error": f"Batch lookup failed: {str(e)}", "success": False}
+
 @mcp.tool
 def get_patient_summary(patient_id: str) -> Dict[str, Any]:
     """
@@ -558,25 +1003,41 @@ def get_patient_summary(patient_id: str) -> Dict[str, Any]:
         Patient summary with demographics, conditions, and recent activity
     """
     
-    if patient_id not in SAMPLE_MEDICAL_DATA:
+    return _patient_summary(patient_id)
+
+def _patient_summary(patient_id: str) -> Dict[str, Any]:
+    """Body of get_patient_summary, for other tools to call"""
+    summary = PATIENT_SUMMARIES.get(patient_id)
+    if summary is None:
         return {
             "error": f"Patient {patient_id} not found",
             "available_patients": list(SAMPLE_MEDICAL_DATA.keys())
         }
     
-    patient_data = SAMPLE_MEDICAL_DATA[patient_id]
-    
-    summary = {
+    return {
         "patient_id": patient_id,
-        "summary_generated": datetime.now().isoformat(),
-        "demographics": patient_data["demographics"],
-        "current_conditions": patient_data["conditions"],
-        "active_medications": len(patient_data["medications"]),
-        "last_visit": patient_data["last_visit"],
-        "vital_signs_last_recorded": patient_data["vital_signs"]
+        "summary_generated": now_iso(),
+        **summary
     }
-    
-    return summary
+
+# Discounts in whole percent - customer tiers (unknown tiers pay standard rates) and bulk batch jobs
+CUSTOMER_DISCOUNT_PCT = {
+    "standard": 0,
+    "premium": 5,
+    "enterprise": 15
+}
+BULK_DISCOUNT_PCT = 10  # batch jobs over 10 documents
+
+# (price per document in cents, customer discount percent) for every analysis/customer tier pair
+BILLING_TABLE = {
+    (analysis_type, customer_tier): (tier.price_cents, discount_pct)
+    for analysis_type, tier in BILLING_TIERS.items()
+    for customer_tier, discount_pct in CUSTOMER_DISCOUNT_PCT.items()
+}
+
+def _percent_of(cents: int, pct: int) -> int:
+    """pct percent of an amount in cents, rounded half up to the cent"""
+    return (cents * pct + 50) // 100
 
 @mcp.tool
 def calculate_billing(
@@ -602,42 +1063,77 @@ def calculate_billing(
         }
     
     tier = BILLING_TIERS[analysis_type]
-    base_price = tier["price"]
-    
-    # Apply volume discounts for batch processing
-    if analysis_type == "batch" and document_count > 10:
-        discount = 0.1  # 10% discount for bulk
-    else:
-        discount = 0.0
-    
-    # Apply customer tier discounts
-    customer_discounts = {
-        "standard": 0.0,
-        "premium": 0.05,
-        "enterprise": 0.15
-    }
-    
-    customer_discount = customer_discounts.get(customer_tier, 0.0)
+    price_cents, customer_discount_pct = (
+        BILLING_TABLE.get((analysis_type, customer_tier)) or BILLING_TABLE[(analysis_type, "standard")]
+    )
+    discount_pct = BULK_DISCOUNT_PCT if analysis_type == "batch" and document_count > 10 else 0
     
-    subtotal = base_price * document_count
-    total_discount = (discount + customer_discount) * subtotal
-    final_total = subtotal - total_discount
+    subtotal_cents = price_cents * document_count
+    total_discount_cents = _percent_of(subtotal_cents, discount_pct + customer_discount_pct)
     
     billing = {
         "analysis_type": analysis_type,
         "document_count": document_count,
-        "base_price_per_document": base_price,
-        "subtotal": round(subtotal, 2),
-        "volume_discount": round(discount * subtotal, 2),
-        "customer_tier_discount": round(customer_discount * subtotal, 2),
-        "total_discount": round(total_discount, 2),
-        "final_total": round(final_total, 2),
+        "base_price_per_document": tier.price,
+        "subtotal": subtotal_cents / 100,
+        "volume_discount": _percent_of(subtotal_cents, discount_pct) / 100,
+        "customer_tier_discount": _percent_of(subtotal_cents, customer_discount_pct) / 100,
+        "total_discount": total_discount_cents / 100,
+        "final_total": (subtotal_cents - total_discount_cents) / 100,
         "currency": "USD",
         "billing_date": datetime.now().isoformat()
     }
     
     return billing
 
+# Static service catalog - built once, returned as-is on every call
+SERVICE_CATALOG = {
+    "service_catalog": {
+        "name": "Medical Document Analysis Service",
+        "version": "1.0.0",
+        "description": "AI-powered medical document analysis and information extraction",
+        "billing_tiers": BILLING_TIER_INFO,
+        "features": {
+            "basic": [
+                "Vital signs extraction",
+                "Medication identification",
+                "Basic condition recognition",
+                "SOAP note parsing"
+            ],
+            "comprehensive": [
+                "All basic features",
+                "Detailed clinical insights",
+                "Risk factor analysis",
+                "Treatment recommendations",
+                "Follow-up scheduling suggestions"
+            ],
+            "batch": [
+                "Bulk document processing",
+                "Volume discounts",
+                "Batch reporting",
+                "API integration support"
+            ]
+        },
+        "supported_document_types": [
+            "SOAP notes",
+            "Lab reports",
+            "Prescription summaries",
+            "Patient histories",
+            "Discharge summaries"
+        ],
+        "compliance": [
+            "HIPAA compliant processing",
+            "PHI data protection",
+            "Audit trail logging"
+        ]
+    },
+    "sample_usage": {
+        "analyze_document": "analyze_medical_document('Patient presents with...', 'comprehensive')",
+        "get_patient_info": "get_patient_summary('patient_001')",
+        "calculate_costs": "calculate_billing('basic', 5, 'premium')"
+    }
+}
+
 @mcp.tool
 def get_available_services() -> Dict[str, Any]:
     """
@@ -647,54 +1143,7 @@ def get_available_services() -> Dict[str, Any]:
         Complete service catalog with pricing and descriptions
     """
     
-    services = {
-        "service_catalog": {
-            "name": "Medical Document Analysis Service",
-            "version": "1.0.0",
-            "description": "AI-powered medical document analysis and information extraction",
-            "billing_tiers": BILLING_TIERS,
-            "features": {
-                "basic": [
-                    "Vital signs extraction",
-                    "Medication identification",
-                    "Basic condition recognition",
-                    "SOAP note parsing"
-                ],
-                "comprehensive": [
-                    "All basic features",
-                    "Detailed clinical insights",
-                    "Risk factor analysis",
-                    "Treatment recommendations",
-                    "Follow-up scheduling suggestions"
-                ],
-                "batch": [
-                    "Bulk document processing",
-                    "Volume discounts",
-                    "Batch reporting",
-                    "API integration support"
-                ]
-            },
-            "supported_document_types": [
-                "SOAP notes",
-                "Lab reports",
-                "Prescription summaries",
-                "Patient histories",
-                "Discharge summaries"
-            ],
-            "compliance": [
-                "HIPAA compliant processing",
-                "PHI data protection",
-                "Audit trail logging"
-            ]
-        },
-        "sample_usage": {
-            "analyze_document": "analyze_medical_document('Patient presents with...', 'comprehensive')",
-            "get_patient_info": "get_patient_summary('patient_001')",
-            "calculate_costs": "calculate_billing('basic', 5, 'premium')"
-        }
-    }
-    
-    return services
+    return SERVICE_CATALOG
 
 @mcp.tool
 def simulate_payment_success(payment_intent_id: str) -> Dict[str, Any]:
@@ -719,6 +1168,44 @@ def simulate_payment_success(payment_intent_id: str) -> Dict[str, Any]:
         "timestamp": datetime.now().isoformat()
     }
 
+# Everything but the timestamp is fixed at startup, API key status included
+HEALTH_BASE = {
+    "status": "healthy",
+    "service": "Medical Agent MCP Server with Stripe Integration",
+    "version": "2.0.0",
+    "api_status": {
+        "stripe_configured": bool(stripe.api_key),
+        "anthropic_configured": bool(anthropic_client),
+        "openai_configured": bool(os.getenv("OPENAI_API_KEY"))
+    },
+    "available_tools": [
+        "analyze_medical_document",
+        "analyze_medical_documents",
+        "analyze_medical_documents_batch",
+        "get_batch_results",
+        "get_patient_summary", 
+        "calculate_billing",
+        "get_available_services",
+        "health_check",
+        "create_customer",
+        "create_payment_intent",
+        "create_payment_intents",
+        "confirm_payment",
+        "process_paid_analysis",
+        "get_customer_info"
+    ],
+    "payment_tools": [
+        "create_customer",
+        "create_payment_intent", 
+        "create_payment_intents",
+        "confirm_payment",
+        "process_paid_analysis",
+        "get_customer_info"
+    ],
+    "billing_tiers_available": list(BILLING_TIERS.keys()),
+    "uptime": "Service running normally"
+}
+
 # Health check function for monitoring
 @mcp.tool
 def health_check() -> Dict[str, Any]:
@@ -729,41 +1216,7 @@ def health_check() -> Dict[str, Any]:
         Service health status and basic metrics
     """
     
-    # Check API keys status
-    api_status = {
-        "stripe_configured": bool(stripe.api_key),
-        "anthropic_configured": bool(anthropic_client),
-        "openai_configured": bool(os.getenv("OPENAI_API_KEY"))
-    }
-    
-    return {
-        "status": "healthy",
-        "service": "Medical Agent MCP Server with Stripe Integration",
-        "version": "2.0.0",
-        "timestamp": datetime.now().isoformat(),
-        "api_status": api_status,
-        "available_tools": [
-            "analyze_medical_document",
-            "get_patient_summary", 
-            "calculate_billing",
-            "get_available_services",
-            "health_check",
-            "create_customer",
-            "create_payment_intent",
-            "confirm_payment",
-            "process_paid_analysis",
-            "get_customer_info"
-        ],
-        "payment_tools": [
-            "create_customer",
-            "create_payment_intent", 
-            "confirm_payment",
-            "process_paid_analysis",
-            "get_customer_info"
-        ],
-        "billing_tiers_available": list(BILLING_TIERS.keys()),
-        "uptime": "Service running normally"
-    }
+    return {**HEALTH_BASE, "timestamp": now_iso()}
 
 # Optional: Add server initialization for local testing
 if __name__ == "__main__":
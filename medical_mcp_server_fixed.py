@@ -10,10 +10,28 @@ from fastmcp import FastMCP
 from typing import Dict, Any, Optional, List
 import json
 import os
+import re
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import time
+from collections import OrderedDict
+from types import MappingProxyType
 from datetime import datetime
 
+try:
+    import orjson
+    from pydantic_core import to_jsonable_python
+    
+    def serialize_tool_result(data: Any) -> str:
+        """Tool results to JSON text via orjson; types it can't handle go through pydantic"""
+        return orjson.dumps(data, default=to_jsonable_python).decode()
+except ImportError:
+    serialize_tool_result = None  # FastMCP's default serializer
+
 # Initialize FastMCP server
-mcp = FastMCP("MedicalAgent")
+mcp = FastMCP("MedicalAgent", tool_serializer=serialize_tool_result)
 
 # Import dependencies conditionally to avoid build issues
 try:
@@ -39,14 +57,97 @@ if STRIPE_AVAILABLE and not stripe.api_key:
 if not ANTHROPIC_AVAILABLE:
     print("Warning: ANTHROPIC_API_KEY not found. AI analysis may be limited.")
 
-# Billing tiers configuration
+# Billing tiers configuration - responses embed these dicts as-is, so never mutate them
 BILLING_TIERS = {
-    "basic": {"price": 0.10, "description": "Basic SOAP analysis - vital signs, medications, basic conditions"},
-    "comprehensive": {"price": 0.50, "description": "Full medical record analysis - detailed insights, recommendations"},
-    "batch": {"price": 0.05, "description": "Bulk processing per document - optimized for multiple files"}
+    "basic": {"price": 0.10, "price_cents": 10, "description": "Basic SOAP analysis - vital signs, medications, basic conditions"},
+    "comprehensive": {"price": 0.50, "price_cents": 50, "description": "Full medical record analysis - detailed insights, recommendations"},
+    "batch": {"price": 0.05, "price_cents": 5, "description": "Bulk processing per document - optimized for multiple files"}
 }
 
-# Sample medical data for demonstration
+# Last formatted timestamp as (unix second, ISO string) - tools reformat at most once a second
+_ts_cache = (0, "")
+
+def iso_now() -> str:
+    """Current local time as a seconds-resolution ISO-8601 string"""
+    global _ts_cache
+    now = int(time.time())
+    if _ts_cache[0] != now:
+        _ts_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+# Keyword scan tables - read-only, in report order; term -> (category, canonical name)
+VITAL_SIGN_TERMS = MappingProxyType({
+    "blood_pressure": ("bp", "blood pressure"),
+    "heart_rate": ("hr", "heart rate"),
+    "temperature": ("temp", "temperature")
+})
+COMMON_MEDS = ("lisinopril", "metformin", "aspirin", "ibuprofen", "synthroid")
+COMMON_CONDITIONS = ("diabetes", "hypertension", "asthma", "copd", "hypothyroidism")
+
+# Terms are lowercased here because the scan runs over lowercased text
+MEDICAL_KEYWORDS = MappingProxyType({
+    **{term.lower(): ("vital_signs", name) for name, terms in VITAL_SIGN_TERMS.items() for term in terms},
+    **{med.lower(): ("medications", med) for med in COMMON_MEDS},
+    **{condition.lower(): ("conditions", condition) for condition in COMMON_CONDITIONS}
+})
+
+# Reported medication/condition names, title-cased once
+MED_NAMES = MappingProxyType({med: med.title() for med in COMMON_MEDS})
+CONDITION_NAMES = MappingProxyType({condition: condition.title() for condition in COMMON_CONDITIONS})
+
+# Single-pass Aho-Corasick automaton over every keyword, built once at import
+try:
+    import ahocorasick
+    KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for term, match in MEDICAL_KEYWORDS.items():
+        KEYWORD_AUTOMATON.add_word(term, match)
+    KEYWORD_AUTOMATON.make_automaton()
+except ImportError:
+    KEYWORD_AUTOMATON = None
+    print("Warning: pyahocorasick not available, using regex keyword scan")
+
+# Fallback: one case-insensitive pass; the lookahead keeps overlapping matches (e.g. "hr" in "synthroid")
+KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(term) for term in sorted(MEDICAL_KEYWORDS, key=len, reverse=True)) + "))",
+    re.IGNORECASE
+)
+
+# The automaton is case-sensitive, so text is lowercased a chunk at a time rather than copied whole.
+# Chunks overlap by the longest keyword so matches spanning a boundary are still seen.
+SCAN_CHUNK_CHARS = 64 * 1024
+KEYWORD_OVERLAP = max(map(len, MEDICAL_KEYWORDS)) - 1
+
+def scan_keywords(text: str) -> frozenset:
+    """Return the (category, name) pairs whose keywords occur in text, ignoring case"""
+    if KEYWORD_AUTOMATON is None:
+        matches = (MEDICAL_KEYWORDS.get(m.group(1).casefold()) for m in KEYWORD_RE.finditer(text))
+        return frozenset(match for match in matches if match)
+    
+    found = set()
+    for start in range(0, len(text), SCAN_CHUNK_CHARS):
+        chunk = text[start:start + SCAN_CHUNK_CHARS + KEYWORD_OVERLAP].lower()
+        found.update(match for _, match in KEYWORD_AUTOMATON.iter(chunk))
+    return frozenset(found)
+
+# Keyword matches by document content hash - retries and batch re-runs skip the scan
+SCAN_CACHE_SIZE = 4096
+_scan_cache: "OrderedDict[bytes, frozenset]" = OrderedDict()
+
+def scan_document(document_content: str) -> frozenset:
+    """scan_keywords() over a document, memoized (LRU) by its BLAKE2b digest"""
+    key = hashlib.blake2b(document_content.encode(), digest_size=16).digest()
+    found = _scan_cache.get(key)
+    if found is not None:
+        _scan_cache.move_to_end(key)
+        return found
+    
+    found = scan_keywords(document_content)
+    _scan_cache[key] = found
+    if len(_scan_cache) > SCAN_CACHE_SIZE:
+        _scan_cache.popitem(last=False)
+    return found
+
+# Sample medical data for demonstration - patient summaries share its nested dicts
 SAMPLE_MEDICAL_DATA = {
     "patient_001": {
         "demographics": {"age": 45, "gender": "male", "medical_record_number": "MRN001"},
@@ -58,6 +159,27 @@ SAMPLE_MEDICAL_DATA = {
     }
 }
 
+# Everything but the timestamp is fixed at startup, API key status included
+HEALTH_BASE = {
+    "status": "healthy",
+    "service": "Medical Agent MCP Server",
+    "version": "2.0.0",
+    "api_status": {
+        "stripe_configured": STRIPE_AVAILABLE and bool(stripe.api_key) if STRIPE_AVAILABLE else False,
+        "anthropic_configured": ANTHROPIC_AVAILABLE,
+        "openai_configured": bool(os.getenv("OPENAI_API_KEY"))
+    },
+    "available_tools": [
+        "health_check",
+        "analyze_medical_document",
+        "get_patient_summary", 
+        "calculate_billing",
+        "get_available_services"
+    ] + (["create_customer", "create_payment_intent", "confirm_payment"] if STRIPE_AVAILABLE else []),
+    "billing_tiers_available": list(BILLING_TIERS.keys()),
+    "uptime": "Service running normally"
+}
+
 # Health check function - must be first for FastMCP Cloud validation
 @mcp.tool
 def health_check() -> Dict[str, Any]:
@@ -68,28 +190,7 @@ def health_check() -> Dict[str, Any]:
         Service health status and basic metrics
     """
     
-    api_status = {
-        "stripe_configured": STRIPE_AVAILABLE and bool(stripe.api_key) if STRIPE_AVAILABLE else False,
-        "anthropic_configured": ANTHROPIC_AVAILABLE,
-        "openai_configured": bool(os.getenv("OPENAI_API_KEY"))
-    }
-    
-    return {
-        "status": "healthy",
-        "service": "Medical Agent MCP Server",
-        "version": "2.0.0",
-        "timestamp": datetime.now().isoformat(),
-        "api_status": api_status,
-        "available_tools": [
-            "health_check",
-            "analyze_medical_document",
-            "get_patient_summary", 
-            "calculate_billing",
-            "get_available_services"
-        ] + (["create_customer", "create_payment_intent", "confirm_payment"] if STRIPE_AVAILABLE else []),
-        "billing_tiers_available": list(BILLING_TIERS.keys()),
-        "uptime": "Service running normally"
-    }
+    return {**HEALTH_BASE, "timestamp": iso_now()}
 
 @mcp.tool
 def analyze_medical_document(
@@ -120,40 +221,28 @@ def analyze_medical_document(
     analysis = {
         "analysis_type": analysis_type,
         "billing_info": tier,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": iso_now(),
         "patient_id": patient_id,
         "extracted_data": {}
     }
     
-    # Basic extraction logic
-    content_lower = document_content.lower()
+    # Basic extraction logic - one keyword pass over the document (cached per document)
+    found = scan_document(document_content)
     
     # Extract vital signs
-    vital_signs = {}
-    if "bp" in content_lower or "blood pressure" in content_lower:
-        vital_signs["blood_pressure"] = "Pattern detected"
-    if "hr" in content_lower or "heart rate" in content_lower:
-        vital_signs["heart_rate"] = "Pattern detected"
-    if "temp" in content_lower or "temperature" in content_lower:
-        vital_signs["temperature"] = "Pattern detected"
+    vital_signs = {
+        name: "Pattern detected" for name in VITAL_SIGN_TERMS if ("vital_signs", name) in found
+    }
     
     analysis["extracted_data"]["vital_signs"] = vital_signs
     
     # Extract medications
-    medications = []
-    common_meds = ["lisinopril", "metformin", "aspirin", "ibuprofen", "synthroid"]
-    for med in common_meds:
-        if med in content_lower:
-            medications.append(med.title())
+    medications = [MED_NAMES[med] for med in COMMON_MEDS if ("medications", med) in found]
     
     analysis["extracted_data"]["medications"] = medications
     
     # Extract conditions
-    conditions = []
-    common_conditions = ["diabetes", "hypertension", "asthma", "copd", "hypothyroidism"]
-    for condition in common_conditions:
-        if condition in content_lower:
-            conditions.append(condition.title())
+    conditions = [CONDITION_NAMES[condition] for condition in COMMON_CONDITIONS if ("conditions", condition) in found]
     
     analysis["extracted_data"]["conditions"] = conditions
     
@@ -194,7 +283,7 @@ def get_patient_summary(patient_id: str) -> Dict[str, Any]:
     
     summary = {
         "patient_id": patient_id,
-        "summary_generated": datetime.now().isoformat(),
+        "summary_generated": iso_now(),
         "demographics": patient_data["demographics"],
         "current_conditions": patient_data["conditions"],
         "active_medications": len(patient_data["medications"]),
@@ -204,6 +293,17 @@ def get_patient_summary(patient_id: str) -> Dict[str, Any]:
     
     return summary
 
+# Discounts in whole percent - customer tiers (unknown tiers pay standard rates) and bulk batch jobs
+CUSTOMER_DISCOUNT_PCT = {"standard": 0, "premium": 5, "enterprise": 15}
+BULK_DISCOUNT_PCT = 10  # batch jobs over 10 documents
+
+# (price per document in cents, customer discount percent) for every analysis/customer tier pair
+PRICE_TABLE = {
+    (analysis_type, customer_tier): (tier["price_cents"], discount_pct)
+    for analysis_type, tier in BILLING_TIERS.items()
+    for customer_tier, discount_pct in CUSTOMER_DISCOUNT_PCT.items()
+}
+
 @mcp.tool
 def calculate_billing(
     analysis_type: str,
@@ -222,36 +322,47 @@ def calculate_billing(
         Billing calculation with itemized costs
     """
     
-    if analysis_type not in BILLING_TIERS:
+    pricing = PRICE_TABLE.get((analysis_type, customer_tier)) or PRICE_TABLE.get((analysis_type, "standard"))
+    if pricing is None:
         return {
             "error": f"Invalid analysis type. Available types: {list(BILLING_TIERS.keys())}"
         }
     
-    tier = BILLING_TIERS[analysis_type]
-    base_price = tier["price"]
-    
-    # Apply volume discounts for batch processing
-    discount = 0.1 if analysis_type == "batch" and document_count > 10 else 0.0
-    
-    # Apply customer tier discounts
-    customer_discounts = {"standard": 0.0, "premium": 0.05, "enterprise": 0.15}
-    customer_discount = customer_discounts.get(customer_tier, 0.0)
+    price_cents, customer_discount_pct = pricing
+    discount_pct = BULK_DISCOUNT_PCT if analysis_type == "batch" and document_count > 10 else 0
     
-    subtotal = base_price * document_count
-    total_discount = (discount + customer_discount) * subtotal
-    final_total = subtotal - total_discount
+    # Integer cents throughout; discounts round half up to the cent
+    subtotal_cents = price_cents * document_count
+    total_discount_cents = (subtotal_cents * (discount_pct + customer_discount_pct) + 50) // 100
+    final_total_cents = subtotal_cents - total_discount_cents
     
     return {
         "analysis_type": analysis_type,
         "document_count": document_count,
-        "base_price_per_document": base_price,
-        "subtotal": round(subtotal, 2),
-        "total_discount": round(total_discount, 2),
-        "final_total": round(final_total, 2),
+        "base_price_per_document": price_cents / 100,
+        "subtotal": subtotal_cents / 100,
+        "total_discount": total_discount_cents / 100,
+        "final_total": final_total_cents / 100,
+        "final_total_cents": final_total_cents,
         "currency": "USD",
-        "billing_date": datetime.now().isoformat()
+        "billing_date": iso_now()
     }
 
+# Static service catalog - built once, returned as-is on every call
+SERVICE_CATALOG = {
+    "service_catalog": {
+        "name": "Medical Document Analysis Service",
+        "version": "2.0.0",
+        "description": "AI-powered medical document analysis",
+        "billing_tiers": BILLING_TIERS,
+        "supported_document_types": [
+            "SOAP notes", "Lab reports", "Prescription summaries", 
+            "Patient histories", "Discharge summaries"
+        ],
+        "compliance": ["HIPAA compliant processing", "PHI data protection"]
+    }
+}
+
 @mcp.tool
 def get_available_services() -> Dict[str, Any]:
     """
@@ -261,25 +372,27 @@ def get_available_services() -> Dict[str, Any]:
         Complete service catalog with pricing and descriptions
     """
     
-    return {
-        "service_catalog": {
-            "name": "Medical Document Analysis Service",
-            "version": "2.0.0",
-            "description": "AI-powered medical document analysis",
-            "billing_tiers": BILLING_TIERS,
-            "supported_document_types": [
-                "SOAP notes", "Lab reports", "Prescription summaries", 
-                "Patient histories", "Discharge summaries"
-            ],
-            "compliance": ["HIPAA compliant processing", "PHI data protection"]
-        }
-    }
+    return SERVICE_CATALOG
 
 # Stripe Payment Tools (only if Stripe is available)
 if STRIPE_AVAILABLE:
     
+    # stripe>=10 has native async methods (Customer.create_async etc., over httpx). Older SDKs
+    # allowed by the stripe>=5 pin are blocking, so their calls run on a private executor -
+    # bursts of Stripe traffic can't starve the default pool other to_thread() users share
+    STRIPE_ASYNC = hasattr(stripe.Customer, "create_async")
+    STRIPE_EXECUTOR = None if STRIPE_ASYNC else ThreadPoolExecutor(max_workers=8, thread_name_prefix="stripe")
+    
+    async def run_stripe(fn, *args, **kwargs):
+        """Run a Stripe SDK class method such as stripe.Customer.create without blocking the loop"""
+        if STRIPE_ASYNC:
+            return await getattr(fn.__self__, f"{fn.__name__}_async")(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            STRIPE_EXECUTOR, functools.partial(fn, *args, **kwargs)
+        )
+    
     @mcp.tool
-    def create_customer(
+    async def create_customer(
         email: str,
         name: Optional[str] = None,
         description: Optional[str] = None
@@ -292,7 +405,8 @@ if STRIPE_AVAILABLE:
             return {"error": "Stripe not configured"}
         
         try:
-            customer = stripe.Customer.create(
+            customer = await run_stripe(
+                stripe.Customer.create,
                 email=email,
                 name=name,
                 description=description or f"Medical Analysis Customer - {email}"
@@ -309,7 +423,7 @@ if STRIPE_AVAILABLE:
             return {"error": f"Stripe error: {str(e)}", "success": False}
 
     @mcp.tool
-    def create_payment_intent(
+    async def create_payment_intent(
         customer_id: str,
         analysis_type: str = "basic",
         document_count: int = 1,
@@ -327,9 +441,10 @@ if STRIPE_AVAILABLE:
         
         try:
             tier = BILLING_TIERS[analysis_type]
-            amount = int(tier["price"] * document_count * 100)
+            amount = tier["price_cents"] * document_count
             
-            payment_intent = stripe.PaymentIntent.create(
+            payment_intent = await run_stripe(
+                stripe.PaymentIntent.create,
                 amount=amount,
                 currency="usd",
                 customer=customer_id,
@@ -353,8 +468,15 @@ if STRIPE_AVAILABLE:
         except Exception as e:
             return {"error": f"Stripe error: {str(e)}", "success": False}
 
+    # Agents poll confirm_payment in tight loops: (expires_at, result) by payment intent ID,
+    # oldest first. Settled payments can't change, so they're kept until evicted.
+    PAYMENT_CACHE_SIZE = 4096
+    PAYMENT_CACHE_TTL = 2.0
+    TERMINAL_PAYMENT_STATUSES = frozenset({"succeeded", "canceled"})
+    _payment_cache: "OrderedDict[str, tuple]" = OrderedDict()
+    
     @mcp.tool
-    def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
+    async def confirm_payment(payment_intent_id: str) -> Dict[str, Any]:
         """
         Confirm and retrieve payment status.
         """
@@ -362,10 +484,15 @@ if STRIPE_AVAILABLE:
         if not stripe.api_key:
             return {"error": "Stripe not configured"}
         
+        cached = _payment_cache.get(payment_intent_id)
+        if cached is not None and cached[0] > time.monotonic():
+            _payment_cache.move_to_end(payment_intent_id)
+            return dict(cached[1])
+        
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            payment_intent = await run_stripe(stripe.PaymentIntent.retrieve, payment_intent_id)
             
-            return {
+            result = {
                 "success": True,
                 "payment_intent_id": payment_intent.id,
                 "status": payment_intent.status,
@@ -377,6 +504,15 @@ if STRIPE_AVAILABLE:
             
         except Exception as e:
             return {"error": f"Stripe error: {str(e)}", "success": False}
+        
+        settled = payment_intent.status in TERMINAL_PAYMENT_STATUSES
+        _payment_cache[payment_intent_id] = (
+            float("inf") if settled else time.monotonic() + PAYMENT_CACHE_TTL, result
+        )
+        _payment_cache.move_to_end(payment_intent_id)
+        if len(_payment_cache) > PAYMENT_CACHE_SIZE:
+            _payment_cache.popitem(last=False)
+        return dict(result)
 
 # Optional: Add server initialization for local testing
 if __name__ == "__main__":
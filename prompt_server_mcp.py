@@ -3,37 +3,118 @@
 MCP Prompt Server for Medical Agent
 Provides dynamic prompts that guide tool usage
 """
-import json
 import sys
 import os
+import re
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+
+import orjson
+
+# {{name}} placeholders in prompt files
+_VAR_RE = re.compile(r"\{\{([^{}]+)\}\}")
+
+# Tool guidance per task - static, so built once at import
+_TOOL_GUIDANCE = {
+    "analyze_file": {
+        "required_tools": ["filesystem"],
+        "steps": [
+            "First, use filesystem tool to read the medical document",
+            "Then analyze the content using medical_processor prompt",
+            "Do NOT attempt to analyze without reading the file first"
+        ],
+        "prompt": "medical_processor"
+    },
+    "patient_summary": {
+        "required_tools": ["filesystem"],
+        "steps": [
+            "Use filesystem to access patient records",
+            "Apply patient_summary prompt for formatting",
+            "Ensure HIPAA compliance in output"
+        ],
+        "prompt": "patient_summary"
+    },
+    "billing": {
+        "required_tools": ["stripe", "filesystem"],
+        "steps": [
+            "First verify the analysis was completed",
+            "Use stripe tool to create billing record",
+            "Do NOT skip billing verification"
+        ],
+        "prompt": None
+    },
+    "fetch_guidelines": {
+        "required_tools": ["fetch"],
+        "steps": [
+            "Use fetch tool to retrieve medical guidelines",
+            "Do NOT make up medical information",
+            "Always cite sources"
+        ],
+        "prompt": None
+    }
+}
+
+_DEFAULT_GUIDANCE = {
+    "required_tools": [],
+    "steps": ["No specific guidance available for this task"],
+    "prompt": None
+}
 
 class PromptServer:
     def __init__(self, prompts_dir: str = "/app/prompts"):
         self.prompts_dir = Path(prompts_dir)
+        # Prompt text by name with the file mtime it was read at - edits are picked up on next use
+        self._cache: Dict[str, Tuple[int, str]] = {}
         self.prompts = self._load_prompts()
+    
+    def _read_prompt(self, prompt_file: Path) -> Optional[str]:
+        """Prompt file text, re-read only when its mtime has changed; None if it is gone"""
+        key = prompt_file.stem
+        try:
+            mtime = prompt_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._cache.pop(key, None)
+            return None
+        
+        cached = self._cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        
+        text = prompt_file.read_text()
+        self._cache[key] = (mtime, text)
+        return text
         
     def _load_prompts(self) -> Dict[str, str]:
         """Load all prompt files from the prompts directory"""
         prompts = {}
         if self.prompts_dir.exists():
             for prompt_file in self.prompts_dir.glob("*.prompt"):
-                key = prompt_file.stem
-                prompts[key] = prompt_file.read_text()
+                text = self._read_prompt(prompt_file)
+                if text is not None:
+                    prompts[prompt_file.stem] = text
         return prompts
     
+    def reload(self):
+        """Rescan the prompts directory, re-reading only new or changed files"""
+        self.prompts = self._load_prompts()
+    
     def get_prompt(self, name: str, context: Dict[str, Any] = None) -> str:
         """Get a specific prompt with optional context substitution"""
         if name not in self.prompts:
             return f"No prompt found for: {name}"
         
-        prompt = self.prompts[name]
+        prompt = self._read_prompt(self.prompts_dir / f"{name}.prompt")
+        if prompt is None:
+            del self.prompts[name]
+            return f"No prompt found for: {name}"
+        self.prompts[name] = prompt
         
-        # Substitute context variables if provided
+        # Substitute context variables if provided - one pass; unknown placeholders are left as-is
         if context:
-            for key, value in context.items():
-                prompt = prompt.replace(f"{{{{{key}}}}}", str(value))
+            prompt = _VAR_RE.sub(
+                lambda m: str(context[m.group(1)]) if m.group(1) in context else m.group(0),
+                prompt
+            )
         
         return prompt
     
@@ -43,50 +124,7 @@ class PromptServer:
     
     def get_tool_guidance(self, task: str) -> Dict[str, Any]:
         """Provide guidance on which tools to use for specific tasks"""
-        tool_guidance = {
-            "analyze_file": {
-                "required_tools": ["filesystem"],
-                "steps": [
-                    "First, use filesystem tool to read the medical document",
-                    "Then analyze the content using medical_processor prompt",
-                    "Do NOT attempt to analyze without reading the file first"
-                ],
-                "prompt": "medical_processor"
-            },
-            "patient_summary": {
-                "required_tools": ["filesystem"],
-                "steps": [
-                    "Use filesystem to access patient records",
-                    "Apply patient_summary prompt for formatting",
-                    "Ensure HIPAA compliance in output"
-                ],
-                "prompt": "patient_summary"
-            },
-            "billing": {
-                "required_tools": ["stripe", "filesystem"],
-                "steps": [
-                    "First verify the analysis was completed",
-                    "Use stripe tool to create billing record",
-                    "Do NOT skip billing verification"
-                ],
-                "prompt": None
-            },
-            "fetch_guidelines": {
-                "required_tools": ["fetch"],
-                "steps": [
-                    "Use fetch tool to retrieve medical guidelines",
-                    "Do NOT make up medical information",
-                    "Always cite sources"
-                ],
-                "prompt": None
-            }
-        }
-        
-        return tool_guidance.get(task, {
-            "required_tools": [],
-            "steps": ["No specific guidance available for this task"],
-            "prompt": None
-        })
+        return _TOOL_GUIDANCE.get(task, _DEFAULT_GUIDANCE)
 
 def handle_mcp_request(request: Dict[str, Any], server: PromptServer) -> Dict[str, Any]:
     """Handle MCP protocol requests"""
@@ -144,51 +182,54 @@ def handle_mcp_request(request: Dict[str, Any], server: PromptServer) -> Dict[st
             "error": f"Unknown method: {method}"
         }
 
+def write_message(message: Dict[str, Any]):
+    """Write one JSON-RPC message to stdout as a single line of bytes"""
+    sys.stdout.buffer.write(orjson.dumps(message) + b"\n")
+    sys.stdout.buffer.flush()
+
+def handle_line(line: bytes, server: PromptServer):
+    """Answer one JSON-RPC request line"""
+    request = None
+    try:
+        request = orjson.loads(line)
+        response = handle_mcp_request(request, server)
+        
+        # Add JSON-RPC fields
+        response["jsonrpc"] = "2.0"
+        response["id"] = request.get("id", 1)
+        
+        write_message(response)
+        
+    except orjson.JSONDecodeError as e:
+        error_response = {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": -32700,
+                "message": "Parse error",
+                "data": str(e)
+            }
+        }
+        write_message(error_response)
+    except Exception as e:
+        error_response = {
+            "jsonrpc": "2.0",
+            "id": request.get("id", 1) if isinstance(request, dict) else None,
+            "error": {
+                "code": -32603,
+                "message": "Internal error",
+                "data": str(e)
+            }
+        }
+        write_message(error_response)
+
 def main():
     """Main MCP server loop"""
     server = PromptServer()
     
-    # MCP uses JSON-RPC over stdio
-    while True:
-        try:
-            line = sys.stdin.readline()
-            if not line:
-                break
-            
-            request = json.loads(line.strip())
-            response = handle_mcp_request(request, server)
-            
-            # Add JSON-RPC fields
-            response["jsonrpc"] = "2.0"
-            response["id"] = request.get("id", 1)
-            
-            print(json.dumps(response))
-            sys.stdout.flush()
-            
-        except json.JSONDecodeError as e:
-            error_response = {
-                "jsonrpc": "2.0",
-                "id": None,
-                "error": {
-                    "code": -32700,
-                    "message": "Parse error",
-                    "data": str(e)
-                }
-            }
-            print(json.dumps(error_response))
-            sys.stdout.flush()
-        except Exception as e:
-            error_response = {
-                "jsonrpc": "2.0",
-                "id": request.get("id", 1) if 'request' in locals() else None,
-                "error": {
-                    "code": -32603,
-                    "message": "Internal error",
-                    "data": str(e)
-                }
-            }
-            print(json.dumps(error_response))
-            sys.stdout.flush()
+    # MCP uses JSON-RPC over stdio - requests are answered in order, one line each
+    while line := sys.stdin.buffer.readline():
+        handle_line(line, server)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,19 @@
+"""
+Keyed request fingerprints for caches, in-flight de-duplication and idempotency keys
+
+Set REQ_HASH_KEY (up to 64 bytes) to share fingerprints across processes;
+otherwise a random per-process key is used.
+"""
+
+import hashlib
+import os
+from typing import Any
+
+import orjson
+
+_KEY = (os.environb.get(b"REQ_HASH_KEY") or os.urandom(16))[:64]
+
+def fingerprint(payload: Any) -> bytes:
+    """16-byte keyed BLAKE2b digest of a JSON-serializable payload"""
+    data = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(data, key=_KEY, digest_size=16).digest()
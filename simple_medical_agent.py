@@ -4,9 +4,28 @@ This version runs without the full MCP server orchestra
 """
 
 import asyncio
+import os
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+# Artificial per-analysis delay in seconds, off by default
+SIMULATED_LATENCY = float(os.getenv("SIMULATE_LATENCY", "0"))
+
+# Findings rules: (case-sensitive terms, terms matched in the lowercased query, report line)
+FINDING_RULES = (
+    (("BP",), ("blood pressure",), "\n- Blood pressure noted: Patient shows signs of hypertension"),
+    ((), ("diabetes",), "\n- Diabetes history documented"),
+    ((), ("chest pain",), "\n- Chest pain reported - recommend cardiac evaluation"),
+    ((), ("metformin", "lisinopril"), "\n- Current medications appear appropriate for documented conditions")
+)
+
+RECOMMENDATIONS = (
+    "\n\nRecommendations:"
+    "\n- Continue current medication regimen"
+    "\n- Monitor blood pressure regularly"
+    "\n- Follow up with primary care physician"
+)
+
 # Mock agent class for testing
 class SimpleMedicalAgent:
     def __init__(self, name: str):
@@ -20,11 +39,12 @@ class SimpleMedicalAgent:
     async def analyze(self, query: str, analysis_type: str = "basic") -> Dict[str, Any]:
         """Perform medical analysis without MCP complexity"""
         
-        # Simulate processing time
-        await asyncio.sleep(0.5)
+        # Simulate processing time only when asked to (e.g. SIMULATE_LATENCY=0.5 for demos)
+        if SIMULATED_LATENCY:
+            await asyncio.sleep(SIMULATED_LATENCY)
         
-        # Create analysis based on query
-        analysis = f"""
+        # Create analysis based on query - collect the pieces, join once at the end
+        parts = [f"""
 Medical Analysis Report
 =======================
 Analysis Type: {analysis_type.upper()}
@@ -34,25 +54,16 @@ Input Query:
 {query}
 
 Clinical Analysis:
-"""
+"""]
+        
+        # Add some basic analysis logic - lowercase once, then check each rule
+        query_lower = query.lower()
+        for terms, lower_terms, finding in FINDING_RULES:
+            if any(term in query for term in terms) or any(term in query_lower for term in lower_terms):
+                parts.append(finding)
         
-        # Add some basic analysis logic
-        if "BP" in query or "blood pressure" in query.lower():
-            analysis += "\n- Blood pressure noted: Patient shows signs of hypertension"
-            
-        if "diabetes" in query.lower():
-            analysis += "\n- Diabetes history documented"
-            
-        if "chest pain" in query.lower():
-            analysis += "\n- Chest pain reported - recommend cardiac evaluation"
-            
-        if any(med in query.lower() for med in ["metformin", "lisinopril"]):
-            analysis += "\n- Current medications appear appropriate for documented conditions"
-            
-        analysis += "\n\nRecommendations:"
-        analysis += "\n- Continue current medication regimen"
-        analysis += "\n- Monitor blood pressure regularly"
-        analysis += "\n- Follow up with primary care physician"
+        parts.append(RECOMMENDATIONS)
+        analysis = "".join(parts)
         
         return {
             "status": "success",
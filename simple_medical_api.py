@@ -2,12 +2,17 @@
 Simple Medical Analysis API without MCP for testing
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, NamedTuple, Optional
+import asyncio
+import contextvars
+import string
+import time
 import uuid
 from datetime import datetime
+from cachetools import TTLCache
 
 app = FastAPI(
     title="Medical Analysis API",
@@ -24,12 +29,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store analysis jobs for async processing
-analysis_jobs = {}
+# Store analysis jobs for async processing - results are evicted after an hour so the store stays bounded.
+# Per-process only; api_server.py keeps jobs in Redis for multi-worker deployments.
+analysis_jobs = TTLCache(maxsize=10_000, ttl=3600)
+
+# Strong references to running jobs so they aren't garbage-collected mid-flight
+_running_jobs = set()
+
+def spawn_job(coro):
+    """Schedule a background job in a fresh, empty context
+    
+    Jobs read no ContextVars, so this skips the copy_context() that
+    BackgroundTasks and a bare create_task() perform per submission.
+    """
+    task = asyncio.create_task(coro, context=contextvars.Context())
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+# Billing tier names; requests naming any other tier are rejected at validation
+TierName = Literal["basic", "comprehensive", "batch"]
 
 class AnalysisRequest(BaseModel):
     customer_id: str
-    type: str = "basic"
+    type: TierName = "basic"
     query: Optional[str] = None
     file_path: Optional[str] = None
 
@@ -42,66 +65,131 @@ class AnalysisResponse(BaseModel):
     tier: Optional[str] = None
     price: Optional[float] = None
 
+class Tier(NamedTuple):
+    price: float
+    description: str
+
 # Billing tiers
 BILLING_TIERS = {
-    "basic": {"price": 0.10, "description": "Basic SOAP analysis"},
-    "comprehensive": {"price": 0.50, "description": "Full medical record analysis"},
-    "batch": {"price": 0.05, "description": "Bulk processing per document"}
+    "basic": Tier(0.10, "Basic SOAP analysis"),
+    "comprehensive": Tier(0.50, "Full medical record analysis"),
+    "batch": Tier(0.05, "Bulk processing per document")
 }
 
+# JSON shape served by /api/billing/tiers, built once
+BILLING_TIER_CATALOG = {name: tier._asdict() for name, tier in BILLING_TIERS.items()}
+
+# Symptom keywords, in report order
+SYMPTOMS = ("pain", "shortness of breath", "cough", "fever", "nausea")
+
+# Every report keyword as (term, case sensitive); a term's bit in scan_terms() masks is 1 << index
+REPORT_TERMS = (
+    ("BP", True), ("HR", True), ("Temp", True), ("mg", True), ("medication", False),
+    *((symptom, False) for symptom in SYMPTOMS)
+)
+TERM_BITS = {term: 1 << index for index, (term, _) in enumerate(REPORT_TERMS)}
+VITAL_SIGN_BITS = TERM_BITS["BP"] | TERM_BITS["HR"] | TERM_BITS["Temp"]
+MEDICATION_BITS = TERM_BITS["mg"] | TERM_BITS["medication"]
+
+# All terms are ASCII, so ASCII-only lowering matches str.lower() for them and keeps offsets aligned
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+try:
+    import ahocorasick
+    # Keyed on the lowered term; case-sensitive terms carry the exact spelling to verify
+    TERM_AUTOMATON = ahocorasick.Automaton()
+    for term, case_sensitive in REPORT_TERMS:
+        TERM_AUTOMATON.add_word(term.lower(), (TERM_BITS[term], term if case_sensitive else None))
+    TERM_AUTOMATON.make_automaton()
+except ImportError:
+    TERM_AUTOMATON = None
+
+def scan_terms(text: str) -> int:
+    """Bitmask of the REPORT_TERMS found in text, in one pass when pyahocorasick is installed"""
+    lowered = text.translate(ASCII_LOWER)
+    if TERM_AUTOMATON is None:
+        mask = 0
+        for term, case_sensitive in REPORT_TERMS:
+            if term in (text if case_sensitive else lowered):
+                mask |= TERM_BITS[term]
+        return mask
+    
+    mask = 0
+    for end, (bit, exact) in TERM_AUTOMATON.iter(lowered):
+        if exact is None or text.startswith(exact, end - len(exact) + 1):
+            mask |= bit
+    return mask
+
+# Last formatted timestamp as (unix second, ISO string) - reports reformat at most once a second.
+# Swapped as one tuple, so background jobs in worker threads always see a matching pair.
+_ts_cache = (0, "")
+
+def iso_now() -> str:
+    """Current local time as a seconds-resolution ISO-8601 string"""
+    global _ts_cache
+    now = int(time.time())
+    if _ts_cache[0] != now:
+        _ts_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+# Fixed report lines, in report order
+VITAL_SIGN_LINES = (
+    ("BP", "- Blood Pressure mentioned\n"),
+    ("HR", "- Heart Rate mentioned\n"),
+    ("Temp", "- Temperature mentioned\n")
+)
+SYMPTOM_LINES = tuple((symptom, f"- {symptom.title()}\n") for symptom in SYMPTOMS)
+MEDICATIONS_SECTION = "**Medications Noted:**\n- Medication dosages detected in the text\n\n"
+REPORT_SUMMARY = (
+    "**Summary:**\n"
+    "This analysis is a simplified demonstration. "
+    "In production, this would use AI-powered analysis with FastAgent and MCP.\n"
+)
+
 def analyze_medical_text(text: str, analysis_type: str) -> str:
     """Simple medical text analysis without MCP"""
     
-    # Extract key medical information
-    analysis = f"**Medical Analysis Report**\n"
-    analysis += f"Analysis Type: {analysis_type.upper()}\n"
-    analysis += f"Timestamp: {datetime.now().isoformat()}\n\n"
+    found = scan_terms(text)
+    
+    parts = [
+        "**Medical Analysis Report**\n"
+        f"Analysis Type: {analysis_type.upper()}\n"
+        f"Timestamp: {iso_now()}\n\n"
+    ]
     
     # Look for vital signs
-    if "BP" in text or "HR" in text or "Temp" in text:
-        analysis += "**Vital Signs Detected:**\n"
-        if "BP" in text:
-            analysis += "- Blood Pressure mentioned\n"
-        if "HR" in text:
-            analysis += "- Heart Rate mentioned\n"
-        if "Temp" in text:
-            analysis += "- Temperature mentioned\n"
-        analysis += "\n"
+    if found & VITAL_SIGN_BITS:
+        parts.append("**Vital Signs Detected:**\n")
+        parts.extend(line for term, line in VITAL_SIGN_LINES if found & TERM_BITS[term])
+        parts.append("\n")
     
     # Look for medications
-    if "mg" in text or "medication" in text.lower():
-        analysis += "**Medications Noted:**\n"
-        analysis += "- Medication dosages detected in the text\n\n"
+    if found & MEDICATION_BITS:
+        parts.append(MEDICATIONS_SECTION)
     
     # Look for symptoms
-    symptoms = ["pain", "shortness of breath", "cough", "fever", "nausea"]
-    found_symptoms = [s for s in symptoms if s in text.lower()]
-    if found_symptoms:
-        analysis += "**Symptoms Identified:**\n"
-        for symptom in found_symptoms:
-            analysis += f"- {symptom.title()}\n"
-        analysis += "\n"
+    symptom_lines = [line for symptom, line in SYMPTOM_LINES if found & TERM_BITS[symptom]]
+    if symptom_lines:
+        parts.append("**Symptoms Identified:**\n")
+        parts.extend(symptom_lines)
+        parts.append("\n")
     
-    # Add summary
-    analysis += "**Summary:**\n"
-    analysis += "This analysis is a simplified demonstration. "
-    analysis += "In production, this would use AI-powered analysis with FastAgent and MCP.\n"
-    
-    return analysis
+    parts.append(REPORT_SUMMARY)
+    return "".join(parts)
 
 async def process_analysis_job(job_id: str, request: AnalysisRequest):
     """Process analysis in background"""
     try:
-        # Simulate analysis
+        # Simulate analysis - queries here are the large ones, so scan off the event loop
         if request.query:
-            analysis_result = analyze_medical_text(request.query, request.type)
+            analysis_result = await asyncio.to_thread(analyze_medical_text, request.query, request.type)
         elif request.file_path:
             analysis_result = f"File analysis for: {request.file_path}\n(File reading would be implemented with MCP filesystem server)"
         else:
             analysis_result = "No content provided for analysis"
         
         # Get billing info
-        tier = BILLING_TIERS.get(request.type, BILLING_TIERS["basic"])
+        tier = BILLING_TIERS[request.type]
         
         # Store result
         analysis_jobs[job_id] = {
@@ -109,7 +197,7 @@ async def process_analysis_job(job_id: str, request: AnalysisRequest):
             "analysis": analysis_result,
             "billed": True,
             "tier": request.type,
-            "price": tier["price"],
+            "price": tier.price,
             "customer_id": request.customer_id
         }
     except Exception as e:
@@ -125,25 +213,26 @@ async def health_check():
     return {"status": "healthy", "service": "medical-agent", "mode": "simplified"}
 
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_document(request: AnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_document(request: AnalysisRequest):
     """Submit medical document for analysis"""
     try:
-        # For small queries, analyze immediately
+        # For small queries, analyze immediately - on the loop, since a sub-500-char scan takes
+        # ~15us and a to_thread hop alone costs several times that (large ones go to a thread)
         if request.query and len(request.query) < 500:
             analysis_result = analyze_medical_text(request.query, request.type)
-            tier = BILLING_TIERS.get(request.type, BILLING_TIERS["basic"])
+            tier = BILLING_TIERS[request.type]
             
             return AnalysisResponse(
                 status="success",
                 analysis=analysis_result,
                 billed=True,
                 tier=request.type,
-                price=tier["price"]
+                price=tier.price
             )
         
         # For larger requests, use background processing
         job_id = str(uuid.uuid4())
-        background_tasks.add_task(process_analysis_job, job_id, request)
+        spawn_job(process_analysis_job(job_id, request))
         
         return AnalysisResponse(
             status="processing",
@@ -168,7 +257,7 @@ async def get_job_status(job_id: str):
 @app.get("/api/billing/tiers")
 async def get_billing_tiers():
     """Get available billing tiers"""
-    return BILLING_TIERS
+    return BILLING_TIER_CATALOG
 
 @app.get("/api/test-customer")
 async def get_test_customer():
@@ -3,6 +3,13 @@ from fastmcp import FastMCP
 # Create FastMCP server instance
 mcp = FastMCP("MedicalAgent")
 
+# Lowercase search terms per finding, built once rather than per call. Each group is ordered
+# most-likely-to-hit first so any() usually stops after one scan ("hr" also matches words
+# like "chronic" and "three", so it hits almost every note)
+VITAL_SIGN_TERMS = ("hr", "bp", "temp", "blood pressure", "heart rate")
+MEDICATION_TERMS = ("lisinopril", "metformin", "aspirin")
+CONDITION_TERMS = ("hypertension", "diabetes", "asthma")
+
 @mcp.tool()
 def health_check() -> str:
     """Health check for the medical server."""
@@ -19,9 +26,9 @@ def analyze_medical_document(document_content: str) -> dict:
     findings = {
         "timestamp": "2025-08-16T04:00:00Z",
         "document_analyzed": True,
-        "vital_signs_detected": any(term in content_lower for term in ["bp", "blood pressure", "hr", "heart rate", "temp"]),
-        "medications_detected": any(med in content_lower for med in ["lisinopril", "metformin", "aspirin"]),
-        "conditions_detected": any(condition in content_lower for condition in ["diabetes", "hypertension", "asthma"]),
+        "vital_signs_detected": any(term in content_lower for term in VITAL_SIGN_TERMS),
+        "medications_detected": any(med in content_lower for med in MEDICATION_TERMS),
+        "conditions_detected": any(condition in content_lower for condition in CONDITION_TERMS),
         "analysis_summary": f"Document contains {len(document_content)} characters"
     }
     
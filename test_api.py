@@ -4,6 +4,12 @@
 import httpx
 import asyncio
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields shown for an analysis result, in display order
+RESULT_FIELDS = ("status", "billed", "tier", "price", "customer_id", "analysis", "error")
 
 async def test_api():
     """Test the medical agent API"""
@@ -11,16 +17,16 @@ async def test_api():
     # API base URL
     base_url = "http://localhost:8000"
     
-    # First, get the test customer
-    async with httpx.AsyncClient() as client:
-        print("1. Getting test customer...")
-        response = await client.get(f"{base_url}/api/test-customer")
+    # First, get the test customer - one keep-alive connection serves every call below
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        logger.info("1. Getting test customer...")
+        response = await client.get("/api/test-customer")
         customer = response.json()
-        print(f"   Customer ID: {customer['customer_id']}")
-        print(f"   Name: {customer['name']}")
+        logger.info("   Customer ID: %s", customer['customer_id'])
+        logger.info("   Name: %s", customer['name'])
         
         # Test with a file
-        print("\n2. Analyzing SOAP note file...")
+        logger.info("\n2. Analyzing SOAP note file...")
         analysis_request = {
             "customer_id": customer['customer_id'],
             "type": "basic",
@@ -28,39 +34,40 @@ async def test_api():
         }
         
         response = await client.post(
-            f"{base_url}/api/analyze",
+            "/api/analyze",
             json=analysis_request
         )
         result = response.json()
-        print(f"   Status: {result['status']}")
+        logger.info("   Status: %s", result['status'])
         
         if result.get('job_id'):
             # If background processing, check job status
-            print(f"   Job ID: {result['job_id']}")
+            logger.info("   Job ID: %s", result['job_id'])
             await asyncio.sleep(2)  # Wait for processing
             
-            response = await client.get(f"{base_url}/api/job/{result['job_id']}")
+            response = await client.get(f"/api/job/{result['job_id']}")
             result = response.json()
         
         # Display results
-        print("\n3. Analysis Results:")
-        print(f"   Status: {result.get('status')}")
-        print(f"   Billed: {result.get('billed')}")
-        print(f"   Tier: {result.get('tier')}")
-        print(f"   Price: ${result.get('price')}")
-        print(f"   Customer ID: {result.get('customer_id')}")
+        status, billed, tier, price, customer_id, analysis, error = map(result.get, RESULT_FIELDS)
+        logger.info("\n3. Analysis Results:")
+        logger.info("   Status: %s", status)
+        logger.info("   Billed: %s", billed)
+        logger.info("   Tier: %s", tier)
+        logger.info("   Price: $%s", price)
+        logger.info("   Customer ID: %s", customer_id)
         
-        if result.get('analysis'):
-            print("\n4. Medical Analysis:")
-            print("-" * 70)
-            print(result['analysis'])
-            print("-" * 70)
+        if analysis:
+            logger.info("\n4. Medical Analysis:")
+            logger.info("-" * 70)
+            logger.info(analysis)
+            logger.info("-" * 70)
         
-        if result.get('error'):
-            print(f"\n   Error: {result['error']}")
+        if error:
+            logger.info("\n   Error: %s", error)
         
         # Test with direct text
-        print("\n5. Testing with direct text query...")
+        logger.info("\n5. Testing with direct text query...")
         analysis_request = {
             "customer_id": customer['customer_id'],
             "type": "comprehensive",
@@ -68,14 +75,15 @@ async def test_api():
         }
         
         response = await client.post(
-            f"{base_url}/api/analyze",
+            "/api/analyze",
             json=analysis_request
         )
         result = response.json()
-        print(f"   Status: {result['status']}")
-        print(f"   Tier: {result.get('tier')}")
-        print(f"   Price: ${result.get('price')}")
+        logger.info("   Status: %s", result['status'])
+        logger.info("   Tier: %s", result.get('tier'))
+        logger.info("   Price: $%s", result.get('price'))
 
 if __name__ == "__main__":
-    print("Testing Medical Agent API...")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("Testing Medical Agent API...")
     asyncio.run(test_api())
@@ -1,14 +1,10 @@
 import asyncio
 import os
-# Import the actual function, not the wrapped tool
-from medical_mcp_server import mcp
+from medical_mcp_server import analyze_medical_document as analyze_tool
 
-# Get the underlying function from the tool registry
-analyze_medical_document = None
-for tool in mcp._tools.values():
-    if tool.name == "analyze_medical_document":
-        analyze_medical_document = tool.func
-        break
+# Import the actual function, not the wrapped tool - FastMCP versions that return a
+# FunctionTool from @mcp.tool keep the original coroutine on .fn
+analyze_medical_document = getattr(analyze_tool, "fn", analyze_tool)
 
 async def test_complicated():
     test_doc = '''SOAP NOTE - Complex Case
@@ -26,7 +26,7 @@ async def test_ai_providers():
     # Test billing tiers
     print(f"💰 Billing Tiers: {len(BILLING_TIERS)} tiers configured")
     for tier, info in BILLING_TIERS.items():
-        print(f"   - {tier}: ${info['price']} - {info['description']}")
+        print(f"   - {tier}: ${info.price} - {info.description}")
     
     print("\n" + "=" * 50)
     
@@ -41,7 +41,7 @@ async def test_ai_providers():
             Assessment: Hypertension, possible angina
             """
             
-            message = anthropic_client.messages.create(
+            message = await anthropic_client.messages.create(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=500,
                 temperature=0.1,
@@ -3,9 +3,13 @@
 Test script to demonstrate proper prompt-guided tool orchestration
 """
 import asyncio
-from medical_agent_enhanced import analyze_with_billing
+import os
 import logging
 
+# Prompt-guided orchestration is the "enhanced" agent mode
+os.environ.setdefault("MEDICAL_AGENT_MODE", "enhanced")
+from medical_agent_mcp import analyze_with_billing
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -60,7 +60,7 @@ STEP 5: Structured Clinical Intelligence Output
 Provide comprehensive analysis in JSON format focusing on clinical accuracy and actionable specialist-level insights."""
 
     if anthropic_client:
-        message = anthropic_client.messages.create(
+        message = await anthropic_client.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=3000,
             temperature=0.1,